@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""Benchmark of the data layer and of the page builders, on synthetic fixtures of increasing size.
+
+For each scale, a fixture is built (see fixture.py) and the benchmarks run in a fresh interpreter pointed to it, so that
+no cache is shared between scales. The caches of the timed functions, and of the cached functions they call, are
+cleared before each call, i.e. the cold cost is measured. Neither AiiDA nor a database are needed: the nodes are served
+from the snapshot of the fixture, and the results isolate the time spent in Python.
+
+    python benchmarks/data_layer.py [--scales 62 1000 10000] [--output results.json] [--compare baseline.json]
+
+With --compare, the script fails if the median time of a benchmark is slower than in the baseline by more than
+--tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+DEFAULT_SCALES = [62, 1000, 10000]
+
+
+def timeit(func, setup=None, repeat=5):
+    """Call setup() then time func(), `repeat` times. Return min and median wall times in ms."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000.)
+    return {'min_ms': min(times), 'median_ms': statistics.median(times), 'repeat': repeat}
+
+
+def run_benchmarks(repeat):
+    """Run all the benchmarks against the fixture set in the environment, and return {name: timings}."""
+    # pylint: disable=import-outside-toplevel
+    import pipeline_pyrenemofs as pm
+    from pipeline_pyrenemofs.snapshot import get_snapshot
+    from pipeline_pyrenemofs.cifstore import get_cif_store
+    from pipeline_pyrenemofs.filters import filter_materials, get_sorted_columns
+    from pipeline_pyrenemofs.similarity import get_similarity_index
+    from select_pyrenemofs.table import get_table
+
+    def clear_all():
+        for func in [get_snapshot, get_cif_store, pm.get_pyrene_mofs_df, pm.get_db_nodes_dict, pm.get_property_table,
+                     pm.get_all_isotherm_nodes, pm.get_isotherms, pm.get_mat_nodes_dict, pm.get_elements, get_table,
+                     get_similarity_index, get_sorted_columns]:
+            func.cache_clear()
+
+    clear_all()
+    db_nodes_dict = pm.get_db_nodes_dict()
+    mat_ids = list(db_nodes_dict)
+    q_list = list(pm.get_quantities().values())
+    opt_id = next(mat_id for mat_id in mat_ids if 'dftopt' in db_nodes_dict[mat_id])
+    iso_id = next(iter(pm.get_all_isotherm_nodes()))
+
+    def clearer(*funcs):
+        """Return a setup clearing the caches of funcs: the timed function and the cached functions it calls."""
+
+        def clear():
+            for func in funcs:
+                func.cache_clear()
+
+        return clear
+
+    results = {
+        'nmaterials': len(mat_ids),
+        'get_db_nodes_dict': timeit(pm.get_db_nodes_dict, clear_all, repeat),
+        'get_figure_values': timeit(lambda: pm.get_figure_values(db_nodes_dict, q_list), None, repeat),
+        'get_table': timeit(get_table, clearer(get_table, pm.get_property_table, pm.get_elements), repeat),
+        # A cache miss of get_mat_nodes_dict: the snapshot lookup, or the query of the material with a database
+        'get_mat_nodes_dict': timeit(lambda: pm.get_mat_nodes_dict(opt_id), pm.get_mat_nodes_dict.cache_clear, repeat),
+        # The isotherms of all the materials (get_isotherm_nodes is a lookup in get_all_isotherm_nodes)
+        'get_isotherms': timeit(pm.get_isotherms, clearer(pm.get_isotherms, pm.get_all_isotherm_nodes), repeat),
+        'get_similarity_index': timeit(get_similarity_index,
+                                       clearer(get_similarity_index, pm.get_property_table, pm.get_elements), repeat),
+    }
+    similarity_index = get_similarity_index()
+    results['similar_nearest'] = timeit(lambda: similarity_index.nearest(opt_id), None, repeat)
+
+    # Two range filters, on the middle half of their values
+    sorted_columns = get_sorted_columns()
+    ranges = {}
+    for q_id in list(sorted_columns.values)[:2]:
+        low, high = sorted_columns.bounds(q_id)
+        ranges[q_id] = (low + (high - low) / 4, high - (high - low) / 4)
+    results['filter_materials'] = timeit(lambda: filter_materials(ranges), None, repeat)
+
+    try:
+        from detail_pyrenemofs.dft_info import plot_energy_steps, ENERGY_PROFILES
+        from detail_pyrenemofs.view import DetailView
+    except ImportError as exc:  # the page builders need bokeh and panel
+        results['plot_energy_steps'] = results['DetailView'] = {'skipped': str(exc)}
+        return results
+
+    dftopt = pm.get_mat_nodes_dict(opt_id)['dftopt']
+    results['plot_energy_steps'] = timeit(lambda: plot_energy_steps(dftopt), ENERGY_PROFILES.clear, repeat)
+    pm.get_isotherms()  # shared by all the pages, as after warm_caches()
+    results['DetailView'] = timeit(lambda: DetailView(iso_id).layout(), pm.get_mat_nodes_dict.cache_clear, repeat)
+    return results
+
+
+def run_scale(nmaterials, repeat):
+    """Build the fixture of a given size, and run the benchmarks in a subprocess pointed to it."""
+    from fixture import build_fixture  # pylint: disable=import-outside-toplevel
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        start = time.perf_counter()
+        env = dict(os.environ, **build_fixture(nmaterials, tmpdir))
+        fixture_s = time.perf_counter() - start
+        result = subprocess.run([sys.executable, __file__, '--worker', '--repeat', str(repeat)],
+                                cwd=ROOT_DIR,
+                                env=env,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True,
+                                check=True)
+    results = json.loads(result.stdout.splitlines()[-1])
+    results['fixture_s'] = fixture_s
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the list of benchmarks slower than in the baseline by more than tolerance (relative)."""
+    regressions = []
+    for scale, benchmarks in results.items():
+        for name, timings in benchmarks.items():
+            try:
+                old, new = baseline[scale][name]['median_ms'], timings['median_ms']
+            except (KeyError, TypeError):
+                continue
+            if new > old * (1 + tolerance):
+                regressions.append("{} @ {}: {:.1f} ms (baseline {:.1f} ms)".format(name, scale, new, old))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES, help="Numbers of materials.")
+    parser.add_argument('--repeat', type=int, default=5, help="Number of timed calls per benchmark.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    parser.add_argument('--compare', help="Compare with the results in this JSON file.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed relative slowdown for --compare.")
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_benchmarks(args.repeat)))
+        return
+
+    results = {}
+    for nmaterials in args.scales:
+        results[str(nmaterials)] = run_scale(nmaterials, args.repeat)
+        print("{} materials:".format(nmaterials))
+        for name, timings in results[str(nmaterials)].items():
+            if isinstance(timings, dict):
+                print("    {:20s} {}".format(
+                    name, timings.get('skipped') or "{min_ms:10.2f} ms (median {median_ms:.2f} ms)".format(**timings)))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Synthetic data fixture for the benchmarks, without AiiDA database.
+
+Builds, for a given number of materials, a snapshot (see pipeline_pyrenemofs.snapshot), a CIF store with the original
+CIFs shipped with the repository (reused cyclically), and an info CSV. Half of the materials are DFT optimized, and one
+third has CO2 isotherms. Zeo++ properties, energy profiles and isotherms are random, with a fixed seed.
+"""
+import glob
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from pipeline_pyrenemofs import CONFIG_DIR, TAG_KEY, GROUP_DIR
+from pipeline_pyrenemofs.cifstore import CifStoreWriter
+from pipeline_pyrenemofs.snapshot import SNAPSHOT_VERSION, SnapshotNode, write_snapshot
+
+ORIG_CIFS_DIR = os.path.join(CONFIG_DIR, 'orig_cifs')
+INFO_CSV = os.path.join(CONFIG_DIR, 'pynene-mofs-info.csv')
+ENERGY_STEPS = 60
+ISOTHERM_POINTS = 10
+
+
+def _node(tag, attributes=None, extras=None, content_sha256=None, label=''):
+    extras = dict(extras or {})
+    extras[TAG_KEY] = tag
+    node_type = 'data.core.cif.CifData.' if content_sha256 else 'data.core.dict.Dict.'
+    return SnapshotNode(uuid=str(uuid.uuid4()),
+                        label=label,
+                        node_type=node_type,
+                        attributes=attributes or {},
+                        extras=extras,
+                        content_sha256=content_sha256).to_dict()
+
+
+def _zeopp(rng):
+    density = rng.uniform(0.3, 2.0)
+    values = {
+        'Density': density,
+        'ASA_m^2/g': rng.uniform(0, 5000),
+        'NASA_m^2/g': rng.uniform(0, 100),
+        'AV_cm^3/g': rng.uniform(0, 2),
+        'POAV_cm^3/g': rng.uniform(0, 2),
+        'PONAV_cm^3/g': rng.uniform(0, 0.1),
+        'Largest_free_sphere': rng.uniform(2, 20),
+        'Largest_included_sphere': rng.uniform(3, 25),
+    }
+    values['AV_Volume_fraction'] = values['AV_cm^3/g'] * density
+    return values
+
+
+def _dftopt(rng):
+    energy = -1000 + np.cumsum(rng.exponential(0.01, ENERGY_STEPS)[::-1])[::-1]
+    return {
+        'natoms': int(rng.integers(50, 500)),
+        'step_info': {
+            'step': list(range(ENERGY_STEPS)),
+            'energy_au': energy.tolist(),
+            'dispersion_energy_au': rng.uniform(-1, 0, ENERGY_STEPS).tolist(),
+            'scf_converged': [True] * ENERGY_STEPS,
+            'cell_a_angs': rng.uniform(10, 30, ENERGY_STEPS).tolist(),
+            'cell_vol_angs3': rng.uniform(1000, 30000, ENERGY_STEPS).tolist(),
+            'max_step_au': rng.uniform(0, 0.1, ENERGY_STEPS).tolist(),
+            'pressure_bar': rng.uniform(-1000, 1000, ENERGY_STEPS).tolist(),
+        },
+        'stage_info': {
+            'nsteps': [ENERGY_STEPS // 2, ENERGY_STEPS - ENERGY_STEPS // 2]
+        },
+    }
+
+
+def _isotherm(rng):
+    pressure = np.linspace(0.1, 30, ISOTHERM_POINTS)
+    loading = rng.uniform(1, 20) * pressure / (pressure + rng.uniform(1, 10))
+    return {
+        'temperature': 298,
+        'temperature_unit': 'K',
+        'isotherm': {
+            'pressure': pressure.tolist(),
+            'pressure_unit': 'bar',
+            'loading_absolute_average': loading.tolist(),
+            'loading_absolute_dev': (0.01 * loading).tolist(),
+            'loading_absolute_unit': 'mol/kg',
+        },
+    }
+
+
+def build_fixture(nmaterials, outdir, seed=0):
+    """Write snapshot.json.gz, cifstore/ and info.csv to outdir.
+
+    Returns the environment variables pointing the apps to the fixture.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(outdir, exist_ok=True)
+    cif_paths = sorted(glob.glob(os.path.join(ORIG_CIFS_DIR, '*.cif')))
+    df_info = pd.read_csv(INFO_CSV)
+
+    rows = []
+    materials = {}
+    isotherms = {}
+    with CifStoreWriter(os.path.join(outdir, 'cifstore')) as writer:
+        cif_sha256 = []
+        for path in cif_paths:
+            with open(path, 'rb') as handle:
+                cif_sha256.append(writer.add(handle.read()))
+
+        for i in range(nmaterials):
+            row = df_info.iloc[i % len(df_info)].to_dict()
+            copy = i // len(df_info)
+            mat_id = row['refcode'] if copy == 0 else '{}{:04d}'.format(row['refcode'], copy)
+            row.update(idx=i + 1, refcode=mat_id)
+            rows.append(row)
+
+            sha256 = cif_sha256[i % len(cif_sha256)]
+            writer.index['refs'].setdefault(mat_id, {})['orig_cif'] = sha256
+            extras = {
+                'name_conventional': row['name'],
+                'class_material': 'mof',
+                'doi_ref': row['DOI'],
+                'workflow_version': 1
+            }
+            nodes = {
+                'orig_cif': _node('orig_cif', extras=extras, content_sha256=sha256, label=mat_id),
+                'orig_zeopp': _node('orig_zeopp', attributes=_zeopp(rng)),
+            }
+            if i % 2 == 0:
+                writer.index['refs'][mat_id]['opt_cif_ddec'] = sha256
+                nodes['opt_cif_ddec'] = _node('opt_cif_ddec', content_sha256=sha256, label=mat_id)
+                nodes['opt_zeopp'] = _node('opt_zeopp', attributes=_zeopp(rng))
+                nodes['dftopt'] = _node('dftopt', attributes=_dftopt(rng))
+            materials[mat_id] = nodes
+            if i % 3 == 0:
+                isotherms[mat_id] = {'co2': [_node('isot_co2', attributes=_isotherm(rng))]}
+
+    pd.DataFrame(rows, columns=df_info.columns).to_csv(os.path.join(outdir, 'info.csv'), index=False)
+    write_snapshot({
+        'version': SNAPSHOT_VERSION,
+        'created': 'fixture',
+        'tag_key': TAG_KEY,
+        'group_dir': GROUP_DIR,
+        'materials': materials,
+        'isotherms': isotherms,
+    }, os.path.join(outdir, 'snapshot.json.gz'))
+
+    return {
+        'PYRENEMOFS_SNAPSHOT': os.path.join(outdir, 'snapshot.json.gz'),
+        'PYRENEMOFS_CIF_STORE': os.path.join(outdir, 'cifstore'),
+        'PYRENEMOFS_INFO_CSV': os.path.join(outdir, 'info.csv'),
+    }
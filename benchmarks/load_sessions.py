@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""Local load test: open Bokeh sessions with headless websocket clients, and report the sessions per second.
+
+Start the server with different values of NUM_PROCS, e.g.:
+
+    NUM_PROCS=4 BOKEH_PREFIX= ./serve-app.sh
+    python benchmarks/load_sessions.py --concurrency 1 2 4 8
+
+Each client pulls the full session document, i.e. the server builds the page as for a browser visit.
+"""
+import argparse
+import json
+import time
+from multiprocessing import Pool
+
+DEFAULT_URL = 'http://localhost:5006'
+
+
+def _pull_sessions(args):
+    """Pull `nsessions` sessions of an app, and return the list of their durations in seconds."""
+    from bokeh.client import pull_session
+
+    url, arguments, nsessions = args
+    durations = []
+    for _ in range(nsessions):
+        start = time.perf_counter()
+        session = pull_session(url=url, arguments=arguments)
+        session.close()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run_load(url, arguments, concurrency, nsessions):
+    """Run `concurrency` clients in parallel, each pulling `nsessions` sessions."""
+    start = time.perf_counter()
+    with Pool(concurrency) as pool:
+        results = pool.map(_pull_sessions, [(url, arguments, nsessions)] * concurrency)
+    elapsed = time.perf_counter() - start
+
+    durations = sorted(d for result in results for d in result)
+    return {
+        'url': url,
+        'concurrency': concurrency,
+        'sessions': len(durations),
+        'elapsed_s': elapsed,
+        'sessions_per_s': len(durations) / elapsed,
+        'median_s': durations[len(durations) // 2],
+        'p95_s': durations[int(len(durations) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', default=DEFAULT_URL, help="Root URL of the server (including the prefix).")
+    parser.add_argument('--app', default='detail_pyrenemofs', help="App to load.")
+    parser.add_argument('--mat-id', default='BOLZIN', help="MAT_ID argument for the detail app.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4], help="Numbers of parallel clients.")
+    parser.add_argument('--sessions', type=int, default=10, help="Number of sessions pulled by each client.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    url = '{}/{}'.format(args.server.rstrip('/'), args.app)
+    arguments = {'mat_id': args.mat_id} if args.app == 'detail_pyrenemofs' else None
+
+    results = []
+    for concurrency in args.concurrency:
+        result = run_load(url, arguments, concurrency, args.sessions)
+        print("{concurrency:4d} clients: {sessions_per_s:7.2f} sessions/s "
+              "(median {median_s:.3f} s, p95 {p95_s:.3f} s)".format(**result))
+        results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+
+if __name__ == '__main__':
+    main()
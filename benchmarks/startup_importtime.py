@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""Startup-time benchmark of the apps, based on `python -X importtime`.
+
+Each module is imported in a fresh interpreter. The script reports the cumulative import time and the heaviest
+imports, and fails if a module exceeds its budget in startup_budget.json or eagerly imports one of its lazy
+dependencies:
+
+    python benchmarks/startup_importtime.py [--output results.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+BUDGET_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'startup_budget.json')
+
+# Lines like: "import time:       123 |        456 |   package.module"
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s+)(\S+)$')
+
+
+def measure_import(module):
+    """Import `module` in a fresh interpreter, and return a dictionary {imported_module: cumulative time in ms}."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            cwd=ROOT_DIR,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            universal_newlines=True,
+                            check=False)
+    if result.returncode != 0:
+        raise RuntimeError("Failed to import {}:\n{}".format(module, result.stderr[-2000:]))
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            cumulative[match.group(4)] = int(match.group(2)) / 1000.
+    return cumulative
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--top', type=int, default=5, help="Number of heaviest imports to report.")
+    parser.add_argument('--output', help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    with open(BUDGET_FILE) as handle:
+        budget = json.load(handle)
+
+    results = {}
+    failures = []
+    for module, limits in budget['modules'].items():
+        cumulative = measure_import(module)
+        total = cumulative.get(module, 0.)
+        eager = sorted(dep for dep in limits['lazy'] if dep in cumulative)
+        heaviest = sorted(((t, m) for m, t in cumulative.items() if m != module), reverse=True)[:args.top]
+        results[module] = {'total_ms': total, 'budget_ms': limits['max_ms'], 'eager_lazy_dependencies': eager}
+
+        print("{}: {:.1f} ms (budget {} ms)".format(module, total, limits['max_ms']))
+        for time_ms, name in heaviest:
+            print("    {:8.1f} ms  {}".format(time_ms, name))
+
+        if total > limits['max_ms']:
+            failures.append("{} takes {:.1f} ms, budget is {} ms".format(module, total, limits['max_ms']))
+        if eager:
+            failures.append("{} eagerly imports {}".format(module, ", ".join(eager)))
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(results, handle, indent=2)
+
+    if failures:
+        print("\nFAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,60 @@
+import os
+
+import numpy as np
 from bokeh.plotting import figure
 import bokeh.models as bmd
 
+from pipeline_pyrenemofs.cache import TTLCache
+from pipeline_pyrenemofs.metrics import timed
+
+HA2EV = 27.211399
+MAX_POINTS = int(os.getenv('PYRENEMOFS_ENERGY_MAX_POINTS', '1000'))  # per trace, larger profiles are downsampled
+
+# Per-material profiles, keyed by the uuid of the dftopt output
+ENERGY_PROFILES = TTLCache()
+
+STEP_KEYS = ['step', 'dispersion_energy_au', 'scf_converged', 'cell_a_angs', 'cell_vol_angs3', 'max_step_au',
+             'pressure_bar']
+
+
+def get_energy_profile(dftopt_out):
+    """Return the step_info of the DFT optimization as a dictionary of NumPy arrays, with the energy in eV/atom.
+
+    The energy is relative to its minimum. The stage lengths are returned in 'nsteps'.
+    The result is cached by uuid: the output Dict is read only once per process.
+    """
+    profile = ENERGY_PROFILES.get(dftopt_out.uuid)
+    if profile is None:
+        step_info = dftopt_out['step_info']
+        energy = np.asarray(step_info['energy_au'], dtype=float) / dftopt_out['natoms'] * HA2EV
+        profile = {key: np.asarray(step_info[key]) for key in STEP_KEYS}
+        profile['energy'] = energy - energy.min()
+        profile['index'] = np.arange(len(energy))
+        profile['nsteps'] = list(dftopt_out['stage_info']['nsteps'])
+        ENERGY_PROFILES.set(dftopt_out.uuid, profile)
+    return profile
+
 
-def get_startindex(steps):
-    '''Take a list of steps and decide starting indices (and final number of steps).'''
-    start_indices = []
-    for i, step in enumerate(steps):
-        if i == 0:
-            start_indices.append(0)
-        else:
-            if step <= steps[i - 1]:
-                start_indices.append(i)
-    start_indices.append(len(steps))
-    return start_indices
+def minmax_indices(values, max_points=MAX_POINTS):
+    """Return the sorted indices of the minimum and maximum of values in max_points/2 buckets.
 
+    Keeps the shape of a long trace with at most max_points points, including its first and last ones.
+    """
+    if len(values) <= max_points:
+        return np.arange(len(values))
+    buckets = np.array_split(np.arange(len(values)), max(max_points // 2 - 1, 1))
+    indices = [0, len(values) - 1]
+    for bucket in buckets:
+        indices.append(bucket[np.argmin(values[bucket])])
+        indices.append(bucket[np.argmax(values[bucket])])
+    return np.unique(indices)
 
-def plot_energy_steps(dftopt_out):  #pylint: disable=too-many-locals
-    """Plot the total energy graph."""
 
-    units = 'eV'
-    ha2u = {'eV': 27.211399}
+@timed
+def plot_energy_steps(dftopt_out, max_points=MAX_POINTS):
+    """Plot the total energy graph, downsampled to max_points if longer."""
 
-    out_dict = dftopt_out.get_dict()
+    profile = get_energy_profile(dftopt_out)
 
     tooltips = [("Step (total)", "@index"), ("Step (stage)", "@step"), ("Energy", "@energy eV/atom"),
                 ("Energy (dispersion)", "@dispersion_energy_au Ha"), ("SCF converged", "@scf_converged"),
@@ -30,32 +63,19 @@ def plot_energy_steps(dftopt_out):  #pylint: disable=too-many-locals
     hover = bmd.HoverTool(tooltips=tooltips)
     TOOLS = ["pan", "wheel_zoom", "box_zoom", "reset", "save", hover]
 
-    natoms = out_dict['natoms']
-    values = [x / natoms * ha2u[units] for x in out_dict['step_info']['energy_au']]
-    values = [x - min(values) for x in values]
-
-    data = bmd.ColumnDataSource(data=dict(
-        index=range(len(values)),
-        step=out_dict['step_info']['step'],
-        energy=values,
-        dispersion_energy_au=out_dict['step_info']['dispersion_energy_au'],
-        scf_converged=out_dict['step_info']['scf_converged'],
-        cell_a_angs=out_dict['step_info']['cell_a_angs'],
-        cell_vol_angs3=out_dict['step_info']['cell_vol_angs3'],
-        max_step_au=out_dict['step_info']['max_step_au'],
-        pressure_bar=out_dict['step_info']['pressure_bar'],
-    ))
+    indices = minmax_indices(profile['energy'], max_points)
+    data = bmd.ColumnDataSource(data={key: profile[key][indices] for key in ['index', 'energy'] + STEP_KEYS})
 
     p = figure(tools=TOOLS, title='Energy profile of the DFT minimization', height=350, width=550)
 
     p.xgrid.grid_line_color = None
     p.xaxis.axis_label = 'Steps'
-    p.yaxis.axis_label = 'Energy ({}/atom)'.format(units)
+    p.yaxis.axis_label = 'Energy (eV/atom)'
 
     # Colored background
     colors = ['red', 'orange', 'green', 'yellow', 'cyan', 'pink', 'palegreen']
     start = 0
-    for i, steps in enumerate(out_dict['stage_info']['nsteps']):
+    for i, steps in enumerate(profile['nsteps']):
         end = start + steps
         p.add_layout(bmd.BoxAnnotation(left=start, right=end, fill_alpha=0.2, fill_color=colors[i]))
         start = end
@@ -0,0 +1,77 @@
+from bokeh.plotting import figure
+from bokeh.palettes import Category10_10
+import bokeh.models as bmd
+
+from detail_pyrenemofs.utils import DETAIL_URL
+from pipeline_pyrenemofs.metrics import timed
+
+
+@timed
+def plot_isotherms(isotherms, gas):
+    """Plot the isotherms of a material for one gas, one line per temperature.
+
+    :param isotherms: list of isotherms, as returned by pipeline_pyrenemofs.get_isotherm_arrays
+    """
+    tooltips = [("Temperature", "@temperature K"), ("Pressure", "@pressure"), ("Loading", "@loading ± @loading_dev")]
+    hover = bmd.HoverTool(tooltips=tooltips)
+    TOOLS = ["pan", "wheel_zoom", "box_zoom", "reset", "save", hover]
+
+    p = figure(tools=TOOLS, title='{} adsorption isotherms'.format(gas.upper()), height=350, width=550)
+    p.xaxis.axis_label = 'Pressure ({})'.format(isotherms[0]['pressure_unit'])
+    p.yaxis.axis_label = 'Uptake ({})'.format(isotherms[0]['loading_unit'])
+
+    for i, isotherm in enumerate(sorted(isotherms, key=lambda x: x['temperature'] or 0)):
+        data = bmd.ColumnDataSource(data=dict(
+            pressure=isotherm['pressure'],
+            loading=isotherm['loading'],
+            loading_dev=isotherm['loading_dev'],
+            temperature=[isotherm['temperature']] * len(isotherm['pressure']),
+        ))
+        color = Category10_10[i % len(Category10_10)]
+        legend = '{} {}'.format(isotherm['temperature'], isotherm['temperature_unit'])
+        p.line('pressure', 'loading', source=data, line_color=color, legend_label=legend)
+        p.circle('pressure', 'loading', source=data, line_color=color, fill_color=color, size=4)
+
+    p.legend.location = 'bottom_right'
+    return p
+
+
+@timed
+def plot_isotherm_overlay(all_isotherms, gas, mat_id, detail_url=DETAIL_URL):
+    """Plot the isotherms of all the materials for one gas, highlighting the one of mat_id.
+
+    Only the isotherms at the same temperature of the first one of mat_id are compared.
+
+    :param all_isotherms: dictionary {mat_id: {gas: [isotherm, ...]}}, as returned by pipeline_pyrenemofs.get_isotherms
+    :param detail_url: template of the URL of the detail pages, opened on tap, with a {mat_id} field
+    """
+    temperature = all_isotherms[mat_id][gas][0]['temperature']
+    selected = [(other_id, isotherm)
+                for other_id, gas_dict in sorted(all_isotherms.items())
+                for isotherm in gas_dict.get(gas, [])
+                if isotherm['temperature'] == temperature]
+    selected.sort(key=lambda x: x[0] == mat_id)  # draw the highlighted isotherm on top
+
+    # One glyph for all the lines: the data is sent in a single ColumnDataSource
+    data = bmd.ColumnDataSource(data=dict(
+        xs=[isotherm['pressure'] for _, isotherm in selected],
+        ys=[isotherm['loading'] for _, isotherm in selected],
+        mat_id=[other_id for other_id, _ in selected],
+        color=['red' if other_id == mat_id else 'lightgray' for other_id, _ in selected],
+        width=[3 if other_id == mat_id else 1 for other_id, _ in selected],
+    ))
+
+    hover = bmd.HoverTool(tooltips=[("MOF", "@mat_id")])
+    tap = bmd.TapTool(callback=bmd.OpenURL(url=detail_url.format(mat_id='@mat_id')))
+    TOOLS = ["pan", "wheel_zoom", "box_zoom", "reset", "save", hover, tap]
+
+    p = figure(tools=TOOLS,
+               title='{} uptake of all pyrene MOFs at {} {}'.format(gas.upper(), temperature,
+                                                                   selected[0][1]['temperature_unit']),
+               height=350,
+               width=550)
+    p.xaxis.axis_label = 'Pressure ({})'.format(selected[0][1]['pressure_unit'])
+    p.yaxis.axis_label = 'Uptake ({})'.format(selected[0][1]['loading_unit'])
+    p.multi_line('xs', 'ys', source=data, line_color='color', line_width='width')
+
+    return p
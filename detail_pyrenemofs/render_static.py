@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Render the detail pages of all the pyrene MOFs into self-contained HTML files.
+
+Usage:
+
+    python -m detail_pyrenemofs.render_static -o static_details -j 4
+
+Each page embeds the Bokeh documents as standalone JSON and can be served by any static file server. Assets use the
+same relative URLs as the app (e.g. detail_pyrenemofs/static/...): serve the output files from the same root. The links
+to other materials point to their static pages.
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import panel as pn
+
+from pipeline_pyrenemofs import get_pyrene_mofs_df
+
+PAGE_FILENAME = 'detail_{mat_id}.html'
+
+
+def _init_worker():
+    pn.extension(css_files=['detail_pyrenemofs/static/style.css'])
+
+
+def render_page(mat_id, outdir):
+    """Render the detail page of a material to <outdir>/detail_<mat_id>.html, and return its path."""
+    from detail_pyrenemofs.view import DetailView
+
+    path = os.path.join(outdir, PAGE_FILENAME.format(mat_id=mat_id))
+    page = DetailView(mat_id, detail_url=PAGE_FILENAME).layout()
+    page.save(path, title='Detail section for {}'.format(mat_id), embed=True)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--outdir', default='static_details', help="Output directory.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of worker processes.")
+    args = parser.parse_args()
+
+    os.makedirs(args.outdir, exist_ok=True)
+    mat_list = list(get_pyrene_mofs_df()['refcode'].values)
+
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=_init_worker) as executor:
+        futures = {executor.submit(render_page, mat_id, args.outdir): mat_id for mat_id in mat_list}
+        for future in as_completed(futures):
+            try:
+                print("{}: {}".format(futures[future], future.result()))
+            except Exception as exc:  # pylint: disable=broad-except
+                print("{}: FAILED ({})".format(futures[future], exc))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+"""Bokeh server lifecycle hooks, run once by each server process."""
+from pipeline_pyrenemofs.refresh import start_refresher
+
+
+def on_server_loaded(server_context):  # pylint: disable=unused-argument
+    from pipeline_pyrenemofs.similarity import get_similarity_index
+
+    # Warms the caches in the background, and refreshes them when the data changes
+    start_refresher(get_similarity_index)
@@ -2,10 +2,22 @@ from jsmol_bokeh_extension import JSMol
 import bokeh.models as bmd
 
 
-def structure_jsmol(cif_node):
+def structure_jsmol(cif_node, cif_url=None):
+    """Return the JSmol applet of a CifData.
+
+    If cif_url is given, JSmol loads the CIF from that URL, otherwise the whole CIF is embedded in the script.
+    """
 
     script_source = bmd.ColumnDataSource()
-    cif_str = cif_node.get_content()
+    if cif_url is not None:
+        load_script = 'load "{}"'.format(cif_url)
+    else:
+        load_script = """load data "cifstring"
+
+{}
+
+end "cifstring"
+""".format(cif_node.get_content())
 
     info = dict(
         height="100%",
@@ -17,12 +29,8 @@ def structure_jsmol(cif_node):
         j2sPath="detail_pyrenemofs/static/jsmol/j2s",
         script="""
 set antialiasDisplay ON;
-load data "cifstring"
-
 {}
-
-end "cifstring"
-""".format(cif_str))
+""".format(load_script))
 
     applet = JSMol(
         width=600,
@@ -1,8 +1,9 @@
 from bokeh.io import curdoc
-from pipeline_pyrenemofs import quantities, EXPLORE_URL
+from pipeline_pyrenemofs import EXPLORE_URL
 import panel as pn
 
 AIIDA_LOGO_PATH = "detail_pyrenemofs/static/aiida-128.png"
+DETAIL_URL = "detail_pyrenemofs?mat_id={mat_id}"  # detail page of a material in the app
 
 
 def get_mat_id():
@@ -81,6 +82,18 @@ def get_provenance_link(uuid, label=None):
     return html_str
 
 
+def get_similar_table(similar, db_nodes_dict, detail_url=DETAIL_URL):
+    """Make a table of links to the detail pages of similar materials, given a list of (mat_id, distance).
+
+    :param detail_url: template of the URL of the detail pages, with a {mat_id} field
+    """
+    rows = ['| Material | Distance |', '|---|---|']
+    for mat_id, distance in similar:
+        name = db_nodes_dict[mat_id]['orig_cif'].extras['name_conventional']
+        rows.append('| [{} ({})]({}) | {:.2f} |'.format(name, mat_id, detail_url.format(mat_id=mat_id), distance))
+    return '\n'.join(rows)
+
+
 def get_title(text, uuid=None):
     """Return pn.Row representation of title.
 
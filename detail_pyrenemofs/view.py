@@ -0,0 +1,183 @@
+"""Layout of the detail page of a material."""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import panel as pn
+from bokeh.io import curdoc
+
+from detail_pyrenemofs.dft_info import plot_energy_steps
+from detail_pyrenemofs.isotherms import plot_isotherms, plot_isotherm_overlay
+from detail_pyrenemofs.structure import structure_jsmol
+from detail_pyrenemofs.utils import DETAIL_URL, get_details_title, get_geom_table, get_similar_table, get_title
+from pipeline_pyrenemofs import get_db_nodes_dict, get_mat_nodes_dict, get_isotherms
+from pipeline_pyrenemofs.metrics import bind_session, current_session, timed
+from pipeline_pyrenemofs.serve import get_cif_url
+from pipeline_pyrenemofs.similarity import get_similar
+
+# Shared by all the sessions of the process: loads the data of the progressive layouts
+EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv('PYRENEMOFS_DETAIL_THREADS', '4')))
+
+NSIMILAR = 5
+
+LOADING_HTML = "<p><i>Loading...</i></p>"
+ERROR_HTML = "<p style='color:red;'><b>Error:</b> {}</p>"
+
+
+class DetailView():
+
+    def __init__(self, mat_id, detail_url=DETAIL_URL):
+        self.mat_id = mat_id
+        self.detail_url = detail_url  # template of the links to the other materials, with a {mat_id} field
+        self.mat_nodes_dict = None
+        self.session_stats = None  # metrics of the session, see layout()
+
+    def load(self):
+        """Load the nodes of the material (blocking)."""
+        if self.mat_nodes_dict is None:
+            self.mat_nodes_dict = get_mat_nodes_dict(self.mat_id)
+        return self.mat_nodes_dict
+
+    @property
+    def title_col(self):
+        col = pn.Column(width=700)
+        col.append(pn.pane.Markdown(get_details_title(self.load()['orig_cif'])))
+        return col
+
+    @timed
+    def structure_section(self):
+        nodes = self.load()
+        if 'opt_cif_ddec' in nodes:
+            return [
+                get_title('Cell optimized structure', uuid=nodes['opt_cif_ddec'].uuid),
+                pn.pane.Bokeh(structure_jsmol(nodes['opt_cif_ddec'], get_cif_url(self.mat_id, 'opt_cif_ddec'))),
+            ]
+        return [
+            get_title('Cell structure (not DFT optimized)', uuid=nodes['orig_cif'].uuid),
+            pn.pane.Bokeh(structure_jsmol(nodes['orig_cif'], get_cif_url(self.mat_id, 'orig_cif'))),
+            pn.pane.Markdown("""
+            ###NOTE:
+            This MOF was not optimized because the framework is charged or DFT failed.
+            """),
+        ]
+
+    @timed
+    def geometry_section(self):
+        nodes = self.load()
+        if 'opt_cif_ddec' in nodes:
+            return [
+                get_title('Geometric properties', uuid=nodes["opt_zeopp"].uuid),
+                pn.pane.Markdown(get_geom_table(nodes["opt_zeopp"])),
+            ]
+        return [
+            get_title('Geometric properties (cell not optimized)', uuid=nodes["orig_zeopp"].uuid),
+            pn.pane.Markdown(get_geom_table(nodes["orig_zeopp"])),
+        ]
+
+    @timed
+    def energy_section(self):
+        nodes = self.load()
+        return [
+            get_title('Energy profile during cell optimization', uuid=nodes['dftopt'].uuid),
+            pn.pane.Bokeh(plot_energy_steps(dftopt_out=nodes['dftopt'])),
+        ]
+
+    @timed
+    def isotherm_section(self):
+        all_isotherms = get_isotherms()
+        section = []
+        for gas, isotherms in sorted(all_isotherms[self.mat_id].items()):
+            section.append(get_title('{} adsorption'.format(gas.upper()), uuid=isotherms[0]['uuid']))
+            section.append(
+                pn.Row(pn.pane.Bokeh(plot_isotherms(isotherms, gas)),
+                       pn.pane.Bokeh(plot_isotherm_overlay(all_isotherms, gas, self.mat_id, self.detail_url))))
+        return section
+
+    @timed
+    def similar_section(self):
+        similar = get_similar(self.mat_id, NSIMILAR)
+        return [
+            get_title('Similar structures'),
+            pn.pane.Markdown("Nearest materials by geometric properties and elements "
+                             "(distance in standard deviations)."),
+            pn.pane.Markdown(get_similar_table(similar, get_db_nodes_dict(), self.detail_url)),
+        ]
+
+    def sections(self):
+        """Return the functions building the sections of the page, in order."""
+        nodes = self.load()
+        sections = [self.structure_section]
+        if ('opt_zeopp' if 'opt_cif_ddec' in nodes else 'orig_zeopp') in nodes:  # not for materials ingested from CIFs
+            sections.append(self.geometry_section)
+        if 'opt_cif_ddec' in nodes:
+            sections.append(self.energy_section)
+        if self.mat_id in get_isotherms():
+            sections.append(self.isotherm_section)
+        sections.append(self.similar_section)
+        return sections
+
+    @property
+    def structure_col(self):
+        col = pn.Column(sizing_mode='stretch_width')
+        for section in self.sections():
+            col.extend(section())
+        return col
+
+    @timed
+    def layout(self, progressive=False):
+        """Return the full page.
+
+        If progressive, return immediately a skeleton of the page, and fill the sections as soon as they are built in
+        the EXECUTOR thread pool. This requires a Bokeh server session, otherwise the page is built synchronously.
+        """
+        doc = curdoc()
+        if not progressive or doc.session_context is None:
+            page = self.title_col
+            page.append(self.structure_col)
+            return page
+
+        self.session_stats = current_session()  # the sections are built in other threads and ticks
+        page = pn.Column(width=700)
+        page.append(pn.pane.Markdown("# Detail section for {}".format(self.mat_id)))
+        page.append(pn.pane.HTML(LOADING_HTML))
+        self._submit(doc, self.sections, partial(self._fill_page, doc, page))
+        return page
+
+    def _submit(self, doc, func, callback):
+        """Run func in the EXECUTOR, then callback(future) on the document thread.
+
+        The calls made by func are recorded in the metrics of the current session, if any.
+        """
+
+        def done(future):
+            doc.add_next_tick_callback(partial(callback, future))
+
+        EXECUTOR.submit(bind_session(func, self.session_stats)).add_done_callback(done)
+
+    def _fill_page(self, doc, page, future):
+        try:
+            sections = future.result()  # the nodes are loaded as well
+            orig_cif = self.mat_nodes_dict['orig_cif']
+        except KeyError:  # unknown mat_id, or material without original CIF
+            page[1] = pn.pane.HTML(ERROR_HTML.format("material {} not found".format(self.mat_id)))
+            return
+        except Exception as exc:  # pylint: disable=broad-except
+            page[1] = pn.pane.HTML(ERROR_HTML.format(exc))
+            return
+
+        page[0] = pn.pane.Markdown(get_details_title(orig_cif))
+        col = pn.Column(sizing_mode='stretch_width')
+        for _ in sections:
+            col.append(pn.pane.HTML(LOADING_HTML))
+        page[1] = col
+
+        for i, section in enumerate(sections):
+            self._submit(doc, section, partial(self._fill_section, col, i))
+
+    @staticmethod
+    def _fill_section(col, index, future):
+        try:
+            col[index] = pn.Column(*future.result(), sizing_mode='stretch_width')
+        except Exception as exc:  # pylint: disable=broad-except
+            col[index] = pn.pane.HTML(ERROR_HTML.format(exc))
@@ -0,0 +1,53 @@
+"""Aggregated rendering of the scatter plot, for more points than the browser can draw as glyphs.
+
+Above AGGREGATE_THRESHOLD points in the visible ranges, the points are binned on the server into a grid of
+AGGREGATE_BINS, colored by the mean of their color values, and sent as a single image. Below it, the visible points are
+sent as glyphs, with hover and tap.
+"""
+import os
+
+import numpy as np
+
+AGGREGATE_THRESHOLD = int(os.getenv('PYRENEMOFS_AGGREGATE_THRESHOLD', '20000'))  # points drawn as glyphs, at most
+AGGREGATE_BINS = (300, 300)  # x, y: 2x2 screen pixels per bin in the 600x600 plot
+RANGE_DEBOUNCE = 200  # ms after the last change of the ranges, before rendering again
+MARGIN = 0.05  # of the data span, on each side of the axes
+
+
+def get_bounds(values, log=False):
+    """Return the (start, end) of an axis showing all the finite (and positive, for log axes) values."""
+    values = values[np.isfinite(values)]
+    if log:
+        values = np.log10(values[values > 0])
+    if not len(values):
+        return (1., 10.) if log else (0., 1.)
+    low, high = float(values.min()), float(values.max())
+    margin = (high - low) * MARGIN if high > low else 0.5
+    low, high = low - margin, high + margin
+    return (10**low, 10**high) if log else (low, high)
+
+
+def visible_rows(x, y, rows, x_range, y_range):
+    """Return the rows whose point (x, y) is within the ranges."""
+    xs, ys = x[rows], y[rows]
+    inside = (xs >= x_range[0]) & (xs <= x_range[1]) & (ys >= y_range[0]) & (ys <= y_range[1])
+    return rows[inside]
+
+
+def aggregate(x, y, color, x_range, y_range, bins=AGGREGATE_BINS, x_log=False, y_log=False):
+    """Return the image of the mean color of the points in each bin over the ranges (NaN for the empty bins).
+
+    The bins are even in the log of the values along the log axes, i.e. even on the screen. The image has the rows
+    along y, as expected by the Bokeh image glyph, and is float32 to halve the message.
+    """
+    finite = np.isfinite(color)
+    x, y, color = x[finite], y[finite], color[finite]
+    if x_log:
+        x, x_range = np.log10(x), np.log10(x_range)
+    if y_log:
+        y, y_range = np.log10(y), np.log10(y_range)
+
+    counts, _, _ = np.histogram2d(x, y, bins=bins, range=[x_range, y_range])
+    sums, _, _ = np.histogram2d(x, y, bins=bins, range=[x_range, y_range], weights=color)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (sums / counts).T.astype(np.float32)
@@ -1,15 +1,22 @@
 # coding: utf-8
+import numpy as np
 import panel as pn
 import param
 from collections import OrderedDict
 import bokeh.models as bmd
 import bokeh.plotting as bpl
+from bokeh.io import curdoc
 from bokeh.palettes import Plasma256
-from pipeline_pyrenemofs import get_db_nodes_dict, get_figure_values
+from figure_pyrenemofs.aggregate import (AGGREGATE_THRESHOLD, RANGE_DEBOUNCE, aggregate, get_bounds,
+                                         visible_rows)
+from pipeline_pyrenemofs import get_property_table
 from pipeline_pyrenemofs import quantities
+from pipeline_pyrenemofs.filters import filter_materials, get_sorted_columns
+from pipeline_pyrenemofs.metrics import session_scope, timed, track_session
 
-from pipeline_pyrenemofs import load_profile
-load_profile()
+MSG = "{} MOFs found.<br> <b>Click on any point for details!</b>"
+MSG_AGGREGATED = "{} MOFs found, {} in view.<br> <b>Zoom in to show and click on the points!</b>"
+EMPTY_IMAGE = {'image': [], 'x': [], 'y': [], 'dw': [], 'dh': []}
 
 def update_legends(p, q_list, hover):
     hover.tooltips = [
@@ -24,26 +31,42 @@ def update_legends(p, q_list, hover):
     p.title.text = "{} [{}]".format(q_list[2]["label"], q_list[2]["unit"])
 
 
-def get_plot(inp_x, inp_y, inp_clr):
-    """Returns a Bokeh plot of the input values, and a message with the number of COFs found."""
+@timed
+def get_plot(inp_x, inp_y, inp_clr, indices=None):
+    """Returns a Bokeh plot of the input values, and a message with the number of COFs found.
+
+    Only the materials at the given positions in the property table are shown (all by default), see update_filter.
+    Above AGGREGATE_THRESHOLD materials, the plot is aggregated, see render_view.
+    """
     q_list = [quantities[label] for label in [inp_x, inp_y, inp_clr]]
-    db_nodes_dict = get_db_nodes_dict() # TODO: try to move outside, to load it once!
-    results = get_figure_values(db_nodes_dict,q_list)  #returns [inp_x_value, inp_y_value, inp_clr_value, cif.label]
+    table = get_property_table()  # columns are sliced: no per-material loop
+    aggregated = len(table) > AGGREGATE_THRESHOLD
+    if indices is None:
+        indices = np.arange(len(table))
 
     # prepare data for plotting
-    nresults = len(results)
-    msg = "{} MOFs found.<br> <b>Click on any point for details!</b>".format(nresults)
-
-    label, x, y, clrs = zip(*results)
-    x = list(map(float, x))
-    y = list(map(float, y))
-    clrs = list(map(float, clrs))
-    mat_id = label
+    msg = MSG.format(len(indices))
 
-    data = {'x': x, 'y': y, 'color': clrs, 'mat_id': mat_id}
+    clrs = table[q_list[2]['id']].to_numpy()
+    data = {
+        'x': table[q_list[0]['id']].to_numpy(),
+        'y': table[q_list[1]['id']].to_numpy(),
+        'color': clrs,
+        'mat_id': table.index.to_numpy(),
+    }
 
     # create bokeh plot
-    source = bmd.ColumnDataSource(data=data)
+    ranges = {}
+    if aggregated:  # the ranges are fixed to the data, and the points are sent by render_view
+        ranges = {
+            'x_range': bmd.Range1d(*get_bounds(data['x'], q_list[0]['scale'] == 'log')),
+            'y_range': bmd.Range1d(*get_bounds(data['y'], q_list[1]['scale'] == 'log')),
+        }
+        data = {key: values[:0] for key, values in data.items()}
+    source = bmd.ColumnDataSource(data=data, name='points')
+    view = bmd.CDSView(source=source,
+                       filters=[bmd.IndexFilter(indices=[] if aggregated else indices.tolist())],
+                       name='points_view')
 
     hover = bmd.HoverTool(tooltips=[])
     tap = bmd.TapTool()
@@ -66,6 +89,7 @@ def get_plot(inp_x, inp_y, inp_clr):
         title_location='right',
         x_axis_type=q_list[0]['scale'],
         y_axis_type=q_list[1]['scale'],
+        **ranges,
     )
     p_new.title.align = 'center'
     p_new.title.text_font_size = '10pt'
@@ -73,15 +97,124 @@ def get_plot(inp_x, inp_y, inp_clr):
     update_legends(p_new, q_list, hover)
     tap.callback = bmd.OpenURL(url="detail_pyrenemofs?mat_id=@mat_id")
 
-    cmap = bmd.LinearColorMapper(palette=Plasma256, low=min(clrs), high=max(clrs))
+    cmap = bmd.LinearColorMapper(palette=Plasma256, low=np.nanmin(clrs), high=np.nanmax(clrs))
     fill_color = {'field': 'color', 'transform': cmap}
-    p_new.circle('x', 'y', size=10, source=source, fill_color=fill_color)
+    points = p_new.circle('x', 'y', size=10, source=source, view=view, fill_color=fill_color)
     cbar = bmd.ColorBar(color_mapper=cmap, location=(0, 0))
     p_new.add_layout(cbar, 'right')
 
+    if aggregated:
+        image_cmap = bmd.LinearColorMapper(palette=Plasma256, low=cmap.low, high=cmap.high, nan_color=(0, 0, 0, 0.))
+        image_source = bmd.ColumnDataSource(data=EMPTY_IMAGE, name='image')
+        p_new.image(image='image', x='x', y='y', dw='dw', dh='dh', source=image_source, color_mapper=image_cmap)
+        hover.renderers = [points]
+        tap.renderers = [points]
+        msg = render_view(p_new, q_list, indices=None if len(indices) == len(table) else indices)
+
     return p_new, msg
 
 
+def is_aggregated(p):
+    return p.select_one({'name': 'image'}) is not None
+
+
+@timed
+def render_view(p, q_list, indices=None):
+    """Render the materials at the given positions (all by default) in the ranges of an aggregated plot, and return the
+    message.
+
+    If there are at most AGGREGATE_THRESHOLD of them, they are sent as glyphs. Otherwise, only the image of their mean
+    color is sent.
+    """
+    table = get_property_table()
+    x, y, color = [table[q['id']].to_numpy() for q in q_list]
+    rows = np.arange(len(table)) if indices is None else indices
+    x_range, y_range = (p.x_range.start, p.x_range.end), (p.y_range.start, p.y_range.end)
+    shown = visible_rows(x, y, rows, x_range, y_range)
+
+    source = p.select_one({'name': 'points'})
+    image_source = p.select_one({'name': 'image'})
+    if len(shown) <= AGGREGATE_THRESHOLD:
+        image_source.data = EMPTY_IMAGE
+        source.data = {'x': x[shown], 'y': y[shown], 'color': color[shown], 'mat_id': table.index.to_numpy()[shown]}
+        p.select_one({'name': 'points_view'}).filters = [bmd.IndexFilter(indices=list(range(len(shown))))]
+        return MSG.format(len(rows))
+
+    image = aggregate(x[shown], y[shown], color[shown], x_range, y_range, x_log=q_list[0]['scale'] == 'log',
+                      y_log=q_list[1]['scale'] == 'log')
+    p.select_one({'name': 'points_view'}).filters = [bmd.IndexFilter(indices=[])]
+    source.data = {key: values[:0] for key, values in source.data.items()}
+    image_source.data = {
+        'image': [image],
+        'x': [x_range[0]],
+        'y': [y_range[0]],
+        'dw': [x_range[1] - x_range[0]],
+        'dh': [y_range[1] - y_range[0]],
+    }
+    return MSG_AGGREGATED.format(len(rows), len(shown))
+
+
+@timed
+def update_plot(p, inp_x, inp_y, inp_clr):
+    """Update in place a plot returned by get_plot, and return the message with the number of COFs found.
+
+    Only the columns whose values change (x, y and/or color), the labels and the color range are sent to the browser:
+    mat_id and the filter of the view are kept. Returns None if the axis scales differ or the plot is aggregated: it
+    needs to be rebuilt with get_plot.
+    """
+    q_list = [quantities[label] for label in [inp_x, inp_y, inp_clr]]
+    axis_types = ['log' if isinstance(axis[0], bmd.LogAxis) else 'linear' for axis in [p.xaxis, p.yaxis]]
+    if axis_types != [q_list[0]['scale'], q_list[1]['scale']] or is_aggregated(p):
+        return None
+
+    table = get_property_table()
+    msg = MSG.format(len(p.select_one({'type': bmd.IndexFilter}).indices))
+
+    clrs = table[q_list[2]['id']].to_numpy()
+    source = p.select_one({'type': bmd.ColumnDataSource})
+    columns = {'x': table[q_list[0]['id']].to_numpy(), 'y': table[q_list[1]['id']].to_numpy(), 'color': clrs}
+    changed = {
+        key: values for key, values in columns.items() if not np.array_equal(source.data[key], values, equal_nan=True)
+    }
+    if changed:  # one ColumnDataChanged message, with the changed columns only
+        source.data.update(changed)
+
+    cmap = p.select_one({'type': bmd.LinearColorMapper})
+    cmap.update(low=np.nanmin(clrs), high=np.nanmax(clrs))
+    update_legends(p, q_list, p.select_one({'type': bmd.HoverTool}))
+
+    return msg
+
+
+@timed
+def update_filter(p, indices):
+    """Show only the materials at the given positions in the property table, and return the message.
+
+    The filter of the view is replaced (the data is not sent again): BokehJS recomputes the view on this change only.
+    """
+    view = p.select_one({'name': 'points_view'})
+    view.filters = [bmd.IndexFilter(indices=indices.tolist())]
+    return MSG.format(len(indices))
+
+
+def get_range_sliders():
+    """Return {quantity id: RangeSlider} spanning the values of the quantities that can be filtered."""
+    sorted_columns = get_sorted_columns()
+    sliders = OrderedDict()
+    for label, q in quantities.items():
+        if q['id'] not in sorted_columns.values:
+            continue
+        low, high = sorted_columns.bounds(q['id'])
+        if not low < high:  # no or a single value
+            continue
+        sliders[q['id']] = pn.widgets.RangeSlider(name='{} [{}]'.format(label, q['unit']),
+                                                  start=low,
+                                                  end=high,
+                                                  value=(low, high),
+                                                  step=(high - low) / 100)
+    return sliders
+
+
 pn.extension()
 
 class StructurePropertyVisualizer(param.Parameterized):
@@ -92,7 +225,55 @@ class StructurePropertyVisualizer(param.Parameterized):
     msg = pn.pane.HTML("")
     _plot = None  # reference to current plot
 
-    @param.depends('x', 'y', 'color')
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.sliders = get_range_sliders()
+        for slider in self.sliders.values():
+            slider.param.watch(self.filter, 'value')  # the message is updated while dragging
+        self.filters = pn.Column(*self.sliders.values(), sizing_mode='stretch_width')
+        self.indices = None  # positions of the materials shown, None for all
+
+        self._doc = curdoc()
+        self._render_callback = None  # pending render_view of an aggregated plot
+
+        # The figure is created once per session, and then updated in place
+        self._plot, self.msg.object = get_plot(self.x, self.y, self.color)
+        self._watch_ranges()
+        self.plot_pane = pn.pane.Bokeh(self._plot)
+
+    @property
+    def q_list(self):
+        return [quantities[label] for label in [self.x, self.y, self.color]]
+
+    def filter(self, *events):  # pylint: disable=unused-argument
+        """Apply the ranges of the sliders to the plot."""
+        self.indices = filter_materials({q_id: slider.value for q_id, slider in self.sliders.items()})
+        if is_aggregated(self._plot):
+            self.msg.object = render_view(self._plot, self.q_list, self.indices)
+        else:
+            self.msg.object = update_filter(self._plot, self.indices)
+
+    def _watch_ranges(self):
+        """Render an aggregated plot again when its ranges change (zoom, pan, reset), once they stop changing."""
+        if not is_aggregated(self._plot):
+            return
+        for plot_range in [self._plot.x_range, self._plot.y_range]:
+            plot_range.on_change('start', self._on_range_change)
+            plot_range.on_change('end', self._on_range_change)
+
+    def _on_range_change(self, attr, old, new):  # pylint: disable=unused-argument
+        if self._render_callback is not None:
+            try:
+                self._doc.remove_timeout_callback(self._render_callback)
+            except ValueError:  # already run
+                pass
+        self._render_callback = self._doc.add_timeout_callback(self._render, RANGE_DEBOUNCE)
+
+    def _render(self):
+        self._render_callback = None
+        self.msg.object = render_view(self._plot, self.q_list, self.indices)
+
+    @param.depends('x', 'y', 'color', watch=True)
     def plot(self):
         selected = [self.x, self.y, self.color]
         unique = set(selected)
@@ -100,15 +281,22 @@ class StructurePropertyVisualizer(param.Parameterized):
             self.msg.object = "<b style='color:red;'>Warning: you are asking to show the same value twice!</b>"
             return self._plot
 
-        self._plot, self.msg.object = get_plot(self.x, self.y, self.color)
+        msg = update_plot(self._plot, self.x, self.y, self.color)
+        if msg is None:
+            self._plot, msg = get_plot(self.x, self.y, self.color, self.indices)
+            self._watch_ranges()
+            self.plot_pane.object = self._plot
+        self.msg.object = msg
         return self._plot
 
 
-explorer = StructurePropertyVisualizer()
+with session_scope(track_session(curdoc(), 'figure_pyrenemofs')):
+    explorer = StructurePropertyVisualizer()
 
-gspec = pn.GridSpec(sizing_mode='stretch_both', max_width=1000, max_height=300)
+gspec = pn.GridSpec(sizing_mode='stretch_both', max_width=1000, max_height=600)
 gspec[0, 0] = explorer.param
-gspec[:2, 1:4] = explorer.plot
+gspec[:4, 1:4] = explorer.plot_pane
 gspec[1, 0] = explorer.msg
+gspec[2:4, 0] = explorer.filters
 
 gspec.servable()
@@ -0,0 +1,8 @@
+"""Bokeh server lifecycle hooks, run once by each server process."""
+from pipeline_pyrenemofs.refresh import start_refresher
+
+
+def on_server_loaded(server_context):  # pylint: disable=unused-argument
+    from pipeline_pyrenemofs.filters import get_sorted_columns
+
+    start_refresher(get_sorted_columns)  # warms the caches in the background, and refreshes them when the data changes
@@ -1,37 +1,147 @@
 #!/usr/bin/env python
-"""Utility to create a folder with opt_cif_ddec CIFs."""
+"""Utility to create a folder (or a zip archive) with opt_cif_ddec CIFs.
 
+The file handles of the CIFs are opened from the AiiDA repository by the main thread (the repository is not
+thread-safe), and streamed to the output in a thread pool, without copies in memory. If more versions of the group of a
+material are found, the CIF of the highest version is exported. The database is only read.
+With --from-store, they are copied from the CIF store (see pipeline_pyrenemofs.cifstore) without any database access.
+
+Usage:
+
+    ./create_cif_opt_dir.py [-o ./cifs_cellopt/] [--zip cifs_cellopt.zip] [-j 8] [--batch-size 100] [--from-store]
+"""
+
+import argparse
 import os
-import datetime
-import pandas as pd
-from aiida.orm.querybuilder import QueryBuilder
-from aiida.orm import Group, CifData
-from aiida.tools.importexport.dbexport import export  # Updated to AiiDA v1.3.0
-from pipeline_pyrenemofs import TAG_KEY, GROUP_DIR
-
-from aiida import load_profile
-load_profile()
-
-CIFS_DIR = "./cifs_cellopt/"
-os.mkdir(CIFS_DIR)
-
-mat_df = pd.read_csv('../pipeline_pyrenemofs/static/pynene-mofs-info.csv')
-mat_list = list(mat_df['refcode'].values)
-
-qb = QueryBuilder()
-qb.append(CifData, filters={'label': {'in': mat_list}}, 
-          tag='n', project='label')
-qb.append(Group, with_node='n', filters={'label': {'like': GROUP_DIR + "%"}}, 
-          tag='g')
-qb.append(CifData, filters={'extras.{}'.format(TAG_KEY): 'opt_cif_ddec'}, with_group='g',
-          project='*')
-qb.order_by({CifData: {'label': 'asc'}})
-
-for q in qb.all():
-    mat_id = q[0]
-    ddec_cif = q[1]
-    ddec_cif.label = mat_id + "_DDEC"
-    filename = '{}_ddec.cif'.format(mat_id)
-    cifile = open(os.path.join(CIFS_DIR, filename), 'w+')
-    print(ddec_cif.get_content(), file=cifile)
-    print("{},{}".format(mat_id, ddec_cif))
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from pipeline_pyrenemofs import TAG_KEY, GROUP_DIR, get_pyrene_mofs_df, load_profile, parse_group_label
+
+
+def get_query(mat_list):
+    """Query the opt_cif_ddec nodes of the materials, projecting (mat_id, group label, CifData)."""
+    from aiida.orm.querybuilder import QueryBuilder
+    from aiida.orm import Group, CifData
+
+    qb = QueryBuilder()
+    qb.append(CifData, filters={'label': {'in': mat_list}}, tag='n', project='label')
+    qb.append(Group, with_node='n', filters={'label': {'like': GROUP_DIR + "%"}}, tag='g', project='label')
+    qb.append(CifData, filters={'extras.{}'.format(TAG_KEY): 'opt_cif_ddec'}, with_group='g', project='*')
+    qb.order_by({'n': {'label': 'asc'}})
+    return qb
+
+
+class DirWriter():
+    """Write each CIF to a file in a directory: safe to call from many threads."""
+
+    def __init__(self, outdir):
+        os.makedirs(outdir, exist_ok=True)
+        self.outdir = outdir
+
+    def write_bytes(self, filename, data):
+        with open(os.path.join(self.outdir, filename), 'wb') as handle:
+            handle.write(data)
+
+    def write_stream(self, filename, source):
+        with open(os.path.join(self.outdir, filename), 'wb') as handle:
+            shutil.copyfileobj(source, handle)
+
+    def close(self):
+        pass
+
+
+class ZipWriter():
+    """Write each CIF to an entry of a zip archive: entries are written one at a time."""
+
+    def __init__(self, path):
+        self.zipfile = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+        self.lock = threading.Lock()
+
+    def write_bytes(self, filename, data):
+        with self.lock, self.zipfile.open(filename, 'w') as handle:
+            handle.write(data)
+
+    def write_stream(self, filename, source):
+        with self.lock, self.zipfile.open(filename, 'w') as handle:
+            shutil.copyfileobj(source, handle)
+
+    def close(self):
+        self.zipfile.close()
+
+
+def get_latest_cif_nodes(qb, batch_size):
+    """Return [(mat_id, CifData)] of the query, keeping the node of the highest group version of each material."""
+    latest = {}  # mat_id: (version, CifData)
+    for mat_id, group_label, cif_node in qb.iterall(batch_size=batch_size):
+        parsed = parse_group_label(group_label)
+        if parsed is not None and parsed[1] > latest.get(mat_id, (-1, None))[0]:
+            latest[mat_id] = (parsed[1], cif_node)
+    return [(mat_id, cif_node) for mat_id, (_, cif_node) in latest.items()]
+
+
+def export_cif(writer, mat_id, uuid, source, stack):
+    """Stream the file handle of a CifData, opened from the repository, to the writer. Close it with the stack."""
+    with stack:
+        writer.write_stream('{}_ddec.cif'.format(mat_id), source)
+    return "{},{}".format(mat_id, uuid)
+
+
+def export_from_store(writer, executor, mat_list):
+    """Write the opt_cif_ddec CIFs from the memory-mapped CIF store, without copies nor database access."""
+    from pipeline_pyrenemofs.cifstore import get_cif_store
+
+    store = get_cif_store()
+    if store is None:
+        raise ValueError("No CIF store found: build it first, see pipeline_pyrenemofs.cifstore")
+
+    mat_set = set(mat_list)
+    refs = [(refcode, sha256) for refcode, _, sha256 in store.refs(tag='opt_cif_ddec') if refcode in mat_set]
+    futures = [
+        executor.submit(writer.write_bytes, '{}_ddec.cif'.format(refcode), store.get_blob(sha256))
+        for refcode, sha256 in refs
+    ]
+    wait(futures)
+    for (refcode, sha256), future in zip(refs, futures):
+        future.result()
+        print("{},{}".format(refcode, sha256))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--outdir', default="./cifs_cellopt/", help="Output directory.")
+    parser.add_argument('--zip', help="Write the CIFs to this zip archive instead of a directory.")
+    parser.add_argument('-j', '--jobs', type=int, default=8, help="Number of I/O threads.")
+    parser.add_argument('--batch-size', type=int, default=100, help="Number of nodes fetched from the DB at once.")
+    parser.add_argument('--from-store', action='store_true', help="Export from the CIF store instead of the DB.")
+    args = parser.parse_args()
+
+    mat_list = list(get_pyrene_mofs_df()['refcode'].values)
+    writer = ZipWriter(args.zip) if args.zip else DirWriter(args.outdir)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+            if args.from_store:
+                export_from_store(writer, executor, mat_list)
+                return
+
+            load_profile()
+            futures = []
+            for mat_id, cif_node in get_latest_cif_nodes(get_query(mat_list), args.batch_size):
+                with ExitStack() as stack:  # opened in this thread, streamed and closed in the pool
+                    source = stack.enter_context(cif_node.open(mode='rb'))
+                    futures.append(executor.submit(export_cif, writer, mat_id, cif_node.uuid, source, stack.pop_all()))
+                if len(futures) >= args.batch_size:  # keep at most one batch of file handles open
+                    for future in wait(futures).done:
+                        print(future.result())
+                    futures = []
+            for future in wait(futures).done:
+                print(future.result())
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
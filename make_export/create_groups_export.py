@@ -1,43 +1,159 @@
 #!/usr/bin/env python
 """Utility to create the export for www.materialscloud.org/discover/pyrene-mofs.
-"""
 
-import sys
-import datetime
-import pandas as pd
-from aiida.orm.querybuilder import QueryBuilder
-from aiida.orm import Group, CifData
-from aiida.tools.importexport.dbexport import export  # Updated to AiiDA v1.3.0
-from pipeline_pyrenemofs import TAG_KEY, GROUP_DIR
+The curated groups are exported in shards of --shard-size materials (one material per shard by default), each with its
+full provenance (calculations and workflows, backward). The shards are exported in parallel processes, with the archive
+API of AiiDA 2.x, to <outdir>/shard_<first refcode>_<hash of the group labels>.aiida. Each shard is written atomically,
+together with the list of its node uuids: rerunning the script only exports the missing shards, and the shards whose
+groups changed (e.g. a new version of a curated group).
 
-from pipeline_pyrenemofs import load_profile
-load_profile()
+With --merge, the union of the nodes of all the shards is exported to a single archive, without traversing the
+provenance again:
 
-mat_df = pd.read_csv('../pipeline_pyrenemofs/static/pynene-mofs-info.csv')
-mat_list = list(mat_df['refcode'].values)
+    ./create_groups_export.py [-o export_shards] [-j 4] [--shard-size 1] [--merge [export_pyrene_mofs_<date>.aiida]]
+"""
 
-qb = QueryBuilder()
-qb.append(CifData, filters={'label': {'in': mat_list}}, tag='n')
-qb.append(Group, with_node='n', filters={'label': {'like': GROUP_DIR + "%"}}, tag='g', project='*')
+import argparse
+import datetime
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+from pipeline_pyrenemofs import GROUP_DIR, get_pyrene_mofs_df, load_profile
 
-kwargs = {
-    # general
-    'entities': qb.all(flat=True),
-    'filename': "export_pyrene_mofs_{}.aiida".format(datetime.date.today().strftime(r'%d%b%y')),
-    'overwrite': True,
-    'silent': False,
-    'use_compression': True,
-    # trasversal rules
+# Traversal rules of the shards (see `verdi archive create --help`)
+TRAVERSAL_RULES = {
     'input_calc_forward': False,  #cli default: False
     'input_work_forward': False,  #cli default: False
     'create_backward': True,  #cli default: True
     'return_backward': True,  #cli default: False
     'call_calc_backward': True,  #cli default: False
     'call_work_backward': True,  #cli default: False
-    # include
+}
+NO_TRAVERSAL = {rule: False for rule in TRAVERSAL_RULES}
+
+# Export options, common to the shards and the merged archive
+EXPORT_OPTIONS = {
+    'overwrite': True,
     'include_comments': True,  #cli default: True
     'include_logs': True,  #cli default: True
 }
-export(**kwargs)
 
+
+def get_group_labels():
+    """Return the sorted labels of the curated groups of the materials in the info CSV."""
+    from aiida.orm import Group, QueryBuilder
+
+    mat_ids = set(get_pyrene_mofs_df()['refcode'].values)
+    qb = QueryBuilder().append(Group, filters={'label': {'like': GROUP_DIR + r'\_%'}}, project=['label'])
+    return sorted(label for label in qb.all(flat=True) if label.split('_')[1] in mat_ids)
+
+
+def get_shard_name(group_labels):
+    """Return the name of a shard: its first material and a hash of its groups, independent of the other shards."""
+    digest = hashlib.sha1('\n'.join(group_labels).encode()).hexdigest()[:12]
+    return 'shard_{}_{}'.format(group_labels[0].split('_')[1], digest)
+
+
+def get_shards(group_labels, shard_size):
+    """Split the groups into shards, named after their content."""
+    shards = {}
+    for start in range(0, len(group_labels), shard_size):
+        labels = group_labels[start:start + shard_size]
+        shards[get_shard_name(labels)] = labels
+    return shards
+
+
+def archive_uuids(path):
+    """Return the uuids of all the nodes in an archive."""
+    from aiida.orm import Node
+    from aiida.tools.archive.abstract import get_format
+
+    with get_format().open(path, 'r') as reader:
+        return reader.querybuilder().append(Node, project=['uuid']).all(flat=True)
+
+
+def export_shard(outdir, name, group_labels):
+    """Export the groups of a shard with their provenance, then record its uuids. Return (name, nodes, seconds)."""
+    from aiida.orm import Group, QueryBuilder
+    from aiida.tools.archive import create_archive
+
+    start = time.perf_counter()
+    path = os.path.join(outdir, name + '.aiida')
+    groups = QueryBuilder().append(Group, filters={'label': {'in': group_labels}}).all(flat=True)
+    create_archive(groups, filename=path + '.tmp', **EXPORT_OPTIONS, **TRAVERSAL_RULES)
+
+    uuids = archive_uuids(path + '.tmp')
+    with open(path + '.uuids.json', 'w') as handle:
+        json.dump({'groups': group_labels, 'uuids': uuids}, handle)
+    os.replace(path + '.tmp', path)  # the shard is complete
+    return name, len(uuids), time.perf_counter() - start
+
+
+def is_done(outdir, name):
+    path = os.path.join(outdir, name + '.aiida')
+    return os.path.isfile(path) and os.path.isfile(path + '.uuids.json')
+
+
+def merge_shards(outdir, shards, filename, batch_size=1000):
+    """Export the union of the nodes of the shards, and their groups, to a single archive without traversal."""
+    from aiida.orm import Group, Node, QueryBuilder
+    from aiida.tools.archive import create_archive
+
+    uuids = set()
+    for name in shards:
+        with open(os.path.join(outdir, name + '.aiida.uuids.json')) as handle:
+            uuids.update(json.load(handle)['uuids'])
+    uuids = sorted(uuids)
+
+    group_labels = [label for labels in shards.values() for label in labels]
+    entities = QueryBuilder().append(Group, filters={'label': {'in': group_labels}}).all(flat=True)
+    for start in range(0, len(uuids), batch_size):
+        qb = QueryBuilder().append(Node, filters={'uuid': {'in': uuids[start:start + batch_size]}})
+        entities.extend(qb.all(flat=True))
+
+    print("Merging {} nodes and {} groups into {}".format(len(uuids), len(group_labels), filename))
+    create_archive(entities, filename=filename, **EXPORT_OPTIONS, **NO_TRAVERSAL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--outdir', default='export_shards', help="Directory of the shards.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of parallel exports.")
+    parser.add_argument('--shard-size', type=int, default=1, help="Number of materials per shard.")
+    parser.add_argument('--merge',
+                        nargs='?',
+                        const="export_pyrene_mofs_{}.aiida".format(datetime.date.today().strftime(r'%d%b%y')),
+                        help="Merge the shards into this archive.")
+    args = parser.parse_args()
+
+    load_profile()
+    os.makedirs(args.outdir, exist_ok=True)
+    shards = get_shards(get_group_labels(), args.shard_size)
+    todo = {name: labels for name, labels in shards.items() if not is_done(args.outdir, name)}
+    print("{} shards, {} to export".format(len(shards), len(todo)))
+
+    # Spawned workers: each one loads the profile with its own database connections
+    with ProcessPoolExecutor(max_workers=args.jobs,
+                             mp_context=multiprocessing.get_context('spawn'),
+                             initializer=load_profile) as executor:
+        futures = {executor.submit(export_shard, args.outdir, name, labels): name for name, labels in todo.items()}
+        for ndone, future in enumerate(as_completed(futures), start=len(shards) - len(todo) + 1):
+            try:
+                name, nnodes, seconds = future.result()
+                print("[{}/{}] {}: {} nodes in {:.1f} s".format(ndone, len(shards), name, nnodes, seconds))
+            except Exception as exc:  # pylint: disable=broad-except
+                print("[{}/{}] {}: FAILED ({})".format(ndone, len(shards), futures[future], exc))
+
+    if args.merge:
+        missing = [name for name in shards if not is_done(args.outdir, name)]
+        if missing:
+            raise SystemExit("Cannot merge: {} shards are missing, rerun the export first.".format(len(missing)))
+        merge_shards(args.outdir, shards, args.merge)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,20 @@
 """Defining my color palette for visualization."""
 import collections
-import yaml
-import pandas as pd
 import re
 import os
 from os.path import join, dirname, realpath
 from frozendict import frozendict
 from functools import lru_cache, wraps
-from aiida.orm.querybuilder import QueryBuilder
-from aiida.orm import Node, Dict, Group, WorkChainNode, CifData
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.metrics import timed, install_sql_counter
+
+# NOTE: heavy dependencies (aiida, pandas, yaml, janitor) are imported only when needed, to keep the import of the
+# apps fast. See benchmarks/startup_importtime.py
 
 TAG_KEY = 'tag4'
 GROUP_DIR = "curated-mof"
 CONFIG_DIR = join(dirname(realpath(__file__)), "static")
+INFO_CSV = os.getenv('PYRENEMOFS_INFO_CSV', join(CONFIG_DIR, 'pynene-mofs-info.csv'))
 EXPLORE_URL = os.getenv('EXPLORE_URL', "https://dev-www.materialscloud.org/explore/curated-cofs")
 
 
@@ -59,11 +61,17 @@ def update_config():
     return config
 
 
+@lru_cache(maxsize=1)
 def load_profile():
+    """Load the AiiDA profile, once per process.
+
+    Called by the functions querying the database: the apps do not need to call it.
+    """
     import aiida
 
     update_config()
     aiida.load_profile()
+    install_sql_counter()
 
 
 def freezeargs(func):
@@ -90,11 +98,6 @@ def freezeargs(func):
     return wrapped
 
 
-# Get quantities
-with open(join(CONFIG_DIR, "quantities.yml"), 'r') as f:
-    quantities_list = yaml.load(f, Loader=yaml.SafeLoader)
-
-
 def _clean(string):
     """Cleaning function for id strings.
 
@@ -109,135 +112,272 @@ def _clean(string):
     return string
 
 
-for item in quantities_list:
-    if 'descr' not in item.keys():
-        item['descr'] = 'Description to be added!'
-    if 'scale' not in item.keys():
-        item['scale'] = 'linear'
-    item['id'] = _clean('{}_{}_{}'.format(item['key'], item['dict'], item['unit']))
+@lru_cache()
+def get_quantities_list():
+    """Get quantities, parsed from quantities.yml."""
+    import yaml
+
+    with open(join(CONFIG_DIR, "quantities.yml"), 'r') as f:
+        quantities_list = yaml.load(f, Loader=yaml.SafeLoader)
 
-quantities = collections.OrderedDict([(q['label'], frozendict(q)) for q in quantities_list])
+    for item in quantities_list:
+        if 'descr' not in item.keys():
+            item['descr'] = 'Description to be added!'
+        if 'scale' not in item.keys():
+            item['scale'] = 'linear'
+        item['id'] = _clean('{}_{}_{}'.format(item['key'], item['dict'], item['unit']))
 
-# keys of all quantities (features & targets)
-QUANTITY_IDS = [q['id'] for k, q in quantities.items()]
+    return quantities_list
 
 
 @lru_cache()
+def get_quantities():
+    """Get the quantities as an OrderedDict {label: quantity}."""
+    return collections.OrderedDict([(q['label'], frozendict(q)) for q in get_quantities_list()])
+
+
+def __getattr__(name):
+    """Parse the quantities lazily, on first access to pipeline_pyrenemofs.quantities (PEP 562)."""
+    if name == 'quantities_list':
+        return get_quantities_list()
+    if name == 'quantities':
+        return get_quantities()
+    if name == 'QUANTITY_IDS':  # keys of all quantities (features & targets)
+        return [q['id'] for k, q in get_quantities().items()]
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+@ttl_cache(ttl=None)
 def get_pyrene_mofs_df():
-    return pd.read_csv('pipeline_pyrenemofs/static/pynene-mofs-info.csv')
+    import pandas as pd
 
+    return pd.read_csv(INFO_CSV)
 
-@lru_cache()
+
+NODE_COLUMNS = ['uuid', 'label', 'node_type', 'extras']
+
+
+def query_tagged_node_rows(group_label_like, attribute_keys=None):
+    """Query the tagged nodes of the curated groups, projecting only the needed columns: no ORM node is instantiated.
+
+    :param group_label_like: pattern of the group labels, e.g. 'curated-mof\\_%\\_v%'
+    :param attribute_keys: list of attributes to project, or None to project all of them
+    :returns: iterator over rows [group label, uuid, label, node_type, extras, attributes], sorted by group label
+    """
+    from aiida.orm.querybuilder import QueryBuilder
+    from aiida.orm import Node, Group
+    load_profile()
+
+    projections = ['attributes'] if attribute_keys is None else ['attributes.{}'.format(k) for k in attribute_keys]
+    qb = QueryBuilder()
+    qb.append(Group, filters={'label': {'like': group_label_like}}, tag='g', project=['label'])
+    qb.append(Node, filters={'extras': {'has_key': TAG_KEY}}, with_group='g', project=NODE_COLUMNS + projections)
+    qb.order_by({'g': {'label': 'asc'}})
+
+    for row in qb.iterall():
+        if attribute_keys is not None:
+            row = list(row[:5]) + [{k: v for k, v in zip(attribute_keys, row[5:]) if v is not None}]
+        yield row
+
+
+GROUP_LABEL_RE = re.compile(r'^[^_]+_([^_]+)_v(\d+)$')  # curated-mof_<mat_id>_v<version>
+
+
+def parse_group_label(group_label):
+    """Return (mat_id, version) of a curated group, or None if the label does not end with _v<integer>."""
+    match = GROUP_LABEL_RE.match(group_label)
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+def pivot_node_rows(rows, mat_ids=None):
+    """Pivot the rows of query_tagged_node_rows into {mat_id: {tag: SnapshotNode}}.
+
+    The mat_id and the version are parsed from the group label (curated-mof_<mat_id>_v<version>), and the groups with
+    another label (e.g., curated-mof_<mat_id>_v2_old) are ignored. If more versions of a group are present, the nodes
+    of the highest version are returned.
+    """
+    from pipeline_pyrenemofs.snapshot import SnapshotNode
+
+    nodes_dict, versions = {}, {}
+    for group_label, uuid, label, node_type, extras, attributes in rows:
+        parsed = parse_group_label(group_label)
+        if parsed is None:
+            continue
+        mat_id, version = parsed
+        if mat_ids is not None and mat_id not in mat_ids:
+            continue
+        if version < versions.get(mat_id, version):
+            continue
+        if version > versions.get(mat_id, version):
+            del nodes_dict[mat_id]  # older version
+        versions[mat_id] = version
+        nodes_dict.setdefault(mat_id, {})[extras[TAG_KEY]] = SnapshotNode(uuid, label, node_type, attributes, extras)
+    return nodes_dict
+
+
+@timed
+@ttl_cache(ttl=None)
 def get_db_nodes_dict():
     """Given return a dictionary with all the curated materials having the material label as key, and a dict of
-    curated nodes as value."""
+    curated nodes as value.
 
-    mat_df = get_pyrene_mofs_df()
-    mat_list = list(mat_df['refcode'].values)
+    If a snapshot was built (see pipeline_pyrenemofs.snapshot), its nodes are returned and the database is not queried.
+    """
+    from pipeline_pyrenemofs.snapshot import get_snapshot
 
-    qb = QueryBuilder()
-    qb.append(CifData, filters={'label': {'in': mat_list}}, tag='n', project=['label'])
-    qb.append(Group, with_node='n', filters={'label': {'like': GROUP_DIR + "%"}}, tag='g')
-    qb.append(Node, filters={'extras': {'has_key': TAG_KEY}}, with_group='g', project=['*'])
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot['materials']
 
-    db_nodes_dict = {}
-    for q in qb.all():
-        mat_label = q[0]
-        if mat_label not in db_nodes_dict:
-            db_nodes_dict[mat_label] = {}
-        n = q[1]
-        db_nodes_dict[mat_label][n.extras[TAG_KEY]] = n
+    # Only the attributes of the Dicts shown in the figure are projected: the rest is read by get_mat_nodes_dict
+    attribute_keys = [q['key'] for q in get_quantities().values() if q['dict'] is not None]
+    rows = query_tagged_node_rows(r'{}\_%\_v%'.format(GROUP_DIR), attribute_keys=attribute_keys)
+    return pivot_node_rows(rows, mat_ids=set(get_pyrene_mofs_df()['refcode'].values))
 
-    return db_nodes_dict
 
+def build_property_table(db_nodes_dict):
+    """Return a DataFrame with one row per material and one float64 column per quantity in QUANTITY_IDS.
 
-def get_figure_values(db_nodes_dict, q_list):
-    """Query the AiiDA database for a list of quantities."""
-
-    figure_values = []
-    for mat, nodes_dict in db_nodes_dict.items():
-        mat_values = [mat]
-        dft_opt = False
-        for n in nodes_dict.keys():
-            if n == 'opt_cif_ddec':
-                dft_opt = True
-                break
-        for q in q_list:
-            if q['key'] == 'is_optimized':
-                mat_values.append(dft_opt)
-            else:
-                for n, v in nodes_dict.items():
-                    if n == ['orig_zeopp', 'opt_zeopp'][dft_opt]:
-                        mat_values.append(v[q['key']])
-                        break
-        figure_values.append(mat_values)
-    return figure_values
-
-
-# Get queries
-@lru_cache(maxsize=128)
-def get_data_aiida(quantitites):
-    """Query the AiiDA database
-
-    :param quantities: tuple of quantities to project
-
-    TODO: the group version needs to be better rationalized!
+    Values are taken from the opt_zeopp Dict for DFT optimized materials, from orig_zeopp otherwise, and are NaN if the
+    material has no such Dict (e.g., materials ingested from their CIF only, see pipeline_pyrenemofs.ingest).
+    The boolean column 'is_optimized' masks the DFT optimized materials.
     """
+    import numpy as np
+    import pandas as pd
+
+    mat_ids = list(db_nodes_dict.keys())
+    is_optimized = np.array(['opt_cif_ddec' in db_nodes_dict[mat] for mat in mat_ids], dtype=bool)
+    zeopp_nodes = [
+        db_nodes_dict[mat].get('opt_zeopp' if dft_opt else 'orig_zeopp') for mat, dft_opt in zip(mat_ids, is_optimized)
+    ]
+    zeopp_dicts = [{} if node is None else node.get_dict() for node in zeopp_nodes]
+
+    columns = collections.OrderedDict()
+    for q in get_quantities().values():
+        if q['key'] == 'is_optimized':
+            columns[q['id']] = is_optimized.astype(np.float64)
+        else:
+            columns[q['id']] = np.array([zeopp.get(q['key'], np.nan) for zeopp in zeopp_dicts], dtype=np.float64)
+    columns['is_optimized'] = is_optimized
+
+    return pd.DataFrame(columns, index=pd.Index(mat_ids, name='mat_id'))
 
-    qb = QueryBuilder()
-    qb.append(Group, filters={'label': {'like': r'curated-cof\_%\_v_'}}, tag='curated_groups')
-    qb.append(Node,
-              project=['label', 'extras.name_conventional', 'extras.class_material'],
-              filters={'extras.{}'.format(TAG_KEY): 'orig_cif'},
-              with_group='curated_groups')
 
-    for q in quantitites:
-        qb.append(Dict,
-                  project=['attributes.{}'.format(q['key'])],
-                  filters={'extras.{}'.format(TAG_KEY): q['dict']},
-                  with_group='curated_groups')
+@timed
+@ttl_cache(ttl=None)
+def get_property_table():
+    """Return the property table of all the curated materials (see build_property_table)."""
+    return build_property_table(get_db_nodes_dict())
 
-    return qb.all()
 
+@timed
+@ttl_cache(ttl=None)
+def get_elements():
+    """Return {mat_id: 'H, C, O, Zn'}, the elements in the original CIF of each material sorted by atomic number.
 
+    Each distinct CIF is parsed once, with pipeline_pyrenemofs.cif. The materials whose CIF cannot be read are missing.
+    """
+    from pipeline_pyrenemofs.cif import parse_cif
+
+    elements, parsed = {}, {}
+    for mat_id, mat_dict in get_db_nodes_dict().items():
+        if 'orig_cif' not in mat_dict:
+            continue
+        node = mat_dict['orig_cif']
+        key = getattr(node, 'content_sha256', None) or node.uuid
+        if key not in parsed:
+            try:
+                parsed[key] = ', '.join(parse_cif(node.get_content())['elements'])
+            except Exception:  # pylint: disable=broad-except
+                parsed[key] = None
+        if parsed[key]:
+            elements[mat_id] = parsed[key]
+    return elements
+
+
+@timed
+def get_figure_values(db_nodes_dict, q_list):
+    """Return a list of [mat_id, value_0, value_1, ...] for a list of quantities.
+
+    Prefer slicing the columns of get_property_table(), which is built only once.
+    """
+    table = build_property_table(db_nodes_dict)
+    columns = [table[q['id']].to_numpy() for q in q_list]
+    return [list(row) for row in zip(table.index, *columns)]
+
+
+@timed
+@ttl_cache()
 def get_mat_nodes_dict(mat_id):
-    """Given a MAT_ID return a dictionary with all the tagged nodes for that material."""
+    """Given a MAT_ID return a dictionary with all the tagged nodes for that material.
 
-    qb = QueryBuilder()
-    qb.append(Group, filters={'label': {'like': r'curated-___\_{}\_v_'.format(mat_id)}}, tag='curated_groups')
-    qb.append(Node, filters={'extras': {'has_key': TAG_KEY}}, with_group='curated_groups')
+    Nodes are resolved into SnapshotNode objects (metadata and Dict attributes, projected by the query), and cached for
+    all the sessions of the process: see get_mat_nodes_dict.cache_info() for the hit/miss counters.
+    The CIF contents are read from the repository only when needed, see SnapshotNode.get_content.
+    """
+    from pipeline_pyrenemofs.snapshot import get_snapshot
 
-    mat_nodes_dict = {}
-    for q in qb.all():
-        n = q[-1]  # if more groups are present with different versions, take the last: QB sorts groups by label
-        mat_nodes_dict[n.extras[TAG_KEY]] = n
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot['materials'].get(mat_id, {})
 
-    return mat_nodes_dict
+    rows = query_tagged_node_rows(r'curated-___\_{}\_v_'.format(mat_id))
+    return pivot_node_rows(rows).get(mat_id, {})
 
 
-@lru_cache(maxsize=8)
-def get_isotherm_nodes(mat_id):
-    """Query the AiiDA database, to get all the isotherms (Dict output of IsothermWorkChain, with GCMC calculations).
-    Returning a dictionary like: {'co2: [Dict_0, Dict_1], 'h2': [Dict_0, Dict_1, Dict_2]}
+def warm_caches():
+    """Fill the process-wide caches, so that the first sessions do not pay the cold cost.
+
+    Called by the refresher of each server process (see pipeline_pyrenemofs.refresh), at startup and whenever the
+    data changes. Only half of the materials cache is filled, to leave room for the current generation during a refresh.
     """
+    db_nodes_dict = get_db_nodes_dict()
+    get_property_table()
+    get_isotherms()
+    for mat_id in list(db_nodes_dict)[:get_mat_nodes_dict.cache.maxsize // 2]:
+        get_mat_nodes_dict(mat_id)
+
+
+@timed
+def query_isotherm_nodes(mat_ids):
+    """Query the AiiDA database, to get all the isotherms (Dict output of IsothermWorkChain, with GCMC calculations)
+    of many materials at once.
+
+    Returning a dictionary like: {'MAT_ID': {'co2': [Dict_0, Dict_1], 'h2': [Dict_0, Dict_1, Dict_2]}, ...},
+    where the Dicts are SnapshotNode objects built from the projected columns, without loading the ORM nodes.
+    """
+    from aiida.orm.querybuilder import QueryBuilder
+    from aiida.orm import Dict, Group, WorkChainNode
+    from pipeline_pyrenemofs.snapshot import SnapshotNode
+    load_profile()
+
+    mat_ids = set(mat_ids)
+    isotherm_nodes = {}
+
+    def add_node(group_label, tag, uuid, label, node_type, extras, attributes):  # pylint: disable=too-many-arguments
+        mat_id = group_label.split("_")[1]
+        if mat_id in mat_ids:
+            gas = tag.split("_")[1]
+            node = SnapshotNode(uuid, label, node_type, attributes, extras)
+            isotherm_nodes.setdefault(mat_id, {}).setdefault(gas, []).append(node)
 
     # Get all the Isotherms
     qb = QueryBuilder()
-    qb.append(Group, filters={'label': {'like': r'curated-___\_{}\_v_'.format(mat_id)}}, tag='mat_group')
-    qb.append(Dict, filters={'extras.{}'.format(TAG_KEY): {'like': r'isot\_%'}}, with_group='mat_group')
-
-    gas_dict = {}
-    for x in qb.all():
-        node = x[0]
-        gas = node.extras[TAG_KEY].split("_")[1]
-        if gas in gas_dict:
-            gas_dict[gas].append(node)
-        else:
-            gas_dict[gas] = [node]
+    qb.append(Group, filters={'label': {'like': r'curated-___\_%\_v_'}}, tag='mat_group', project=['label'])
+    qb.append(Dict,
+              filters={'extras.{}'.format(TAG_KEY): {
+                           'like': r'isot\_%'
+                       }},
+              with_group='mat_group',
+              project=['extras.{}'.format(TAG_KEY)] + NODE_COLUMNS + ['attributes'])
+    qb.order_by({'mat_group': {'label': 'asc'}})
+
+    for row in qb.iterall():
+        add_node(*row)
 
     # Quite diry way to get all the isotherms from an IsothermMultiTemp
     qb = QueryBuilder()
-    qb.append(Group, filters={'label': {'like': r'curated-___\_{}\_v_'.format(mat_id)}}, tag='mat_group')
+    qb.append(Group, filters={'label': {'like': r'curated-___\_%\_v_'}}, tag='mat_group', project=['label'])
     qb.append(Dict,
               filters={'extras.{}'.format(TAG_KEY): {
                            'like': r'isotmt\_%'
@@ -252,17 +392,81 @@ def get_isotherm_nodes(mat_id):
               }},
               with_incoming='isotmt_wc',
               tag='isot_wc')
-    qb.append(Dict, edge_filters={'label': 'output_parameters'}, with_incoming='isot_wc', project=['*'])
+    qb.append(Dict,
+              edge_filters={'label': 'output_parameters'},
+              with_incoming='isot_wc',
+              project=NODE_COLUMNS + ['attributes'])
+    qb.order_by({'mat_group': {'label': 'asc'}})
 
-    for x in qb.all():
-        node = x[1]
-        gas = x[0].split("_")[1]
-        if gas in gas_dict:
-            gas_dict[gas].append(node)
-        else:
-            gas_dict[gas] = [node]
+    for row in qb.iterall():
+        add_node(*row)
+
+    return isotherm_nodes
+
+
+@timed
+@ttl_cache(ttl=None)
+def get_all_isotherm_nodes():
+    """Return the isotherm nodes of all the curated materials, from the snapshot or with one bulk database query.
+
+    Returning a dictionary like: {'MAT_ID': {'co2': [Dict_0, Dict_1], 'h2': [Dict_0, Dict_1, Dict_2]}, ...}
+    """
+    from pipeline_pyrenemofs.snapshot import get_snapshot
+
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot['isotherms']
+
+    return query_isotherm_nodes(get_db_nodes_dict().keys())
 
-    return gas_dict
+
+def get_isotherm_nodes(mat_id):
+    """Get all the isotherms (Dict output of IsothermWorkChain, with GCMC calculations) of a material.
+    Returning a dictionary like: {'co2: [Dict_0, Dict_1], 'h2': [Dict_0, Dict_1, Dict_2]}
+    """
+    return get_all_isotherm_nodes().get(mat_id, {})
+
+
+def get_isotherm_arrays(isotherm_dict):
+    """Extract from the output Dict of an IsothermWorkChain the isotherm as NumPy arrays.
+
+    Returns None if no isotherm was computed, e.g., for non-porous materials.
+    """
+    import numpy as np
+
+    isotherm = isotherm_dict.get('isotherm')
+    if not isotherm:
+        return None
+
+    pressure = np.asarray(isotherm['pressure'], dtype=np.float64)
+    return {
+        'temperature': isotherm_dict.get('temperature'),
+        'temperature_unit': isotherm_dict.get('temperature_unit', 'K'),
+        'pressure': pressure,
+        'pressure_unit': isotherm.get('pressure_unit', 'bar'),
+        'loading': np.asarray(isotherm['loading_absolute_average'], dtype=np.float64),
+        'loading_dev': np.broadcast_to(isotherm.get('loading_absolute_dev', np.nan), pressure.shape).astype(np.float64),
+        'loading_unit': isotherm.get('loading_absolute_unit', 'mol/kg'),
+    }
+
+
+@timed
+@ttl_cache(ttl=None)
+def get_isotherms():
+    """Return the isotherms of all the curated materials, with pressure and loading as NumPy arrays.
+
+    Returning a dictionary like: {'MAT_ID': {'co2': [isotherm_0, isotherm_1], ...}, ...},
+    where each isotherm is a dictionary returned by get_isotherm_arrays, including the 'uuid' of the Dict.
+    """
+    isotherms = {}
+    for mat_id, gas_dict in get_all_isotherm_nodes().items():
+        for gas, nodes in gas_dict.items():
+            for node in nodes:
+                isotherm = get_isotherm_arrays(node.get_dict())
+                if isotherm is not None:
+                    isotherm['uuid'] = node.uuid
+                    isotherms.setdefault(mat_id, {}).setdefault(gas, []).append(isotherm)
+    return isotherms
 
 
 # Get color palette
@@ -0,0 +1,147 @@
+"""Process-wide caches, shared across all the Bokeh sessions served by the same process."""
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+CACHE_SIZE = int(os.getenv('PYRENEMOFS_CACHE_SIZE', '64'))
+CACHE_TTL = float(os.getenv('PYRENEMOFS_CACHE_TTL', '3600'))  # seconds
+
+
+class TTLCache():
+    """Thread-safe cache evicting the least recently used entries, and the entries older than `ttl` seconds.
+
+    Hits and misses are counted, to help sizing the cache.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key: (timestamp, value)
+        self._lock = threading.Lock()
+
+    def _expired(self, timestamp):
+        return self.ttl is not None and time.monotonic() - timestamp > self.ttl
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`, or `default` if missing or expired."""
+        with self._lock:
+            if key in self._data:
+                timestamp, value = self._data[key]
+                if not self._expired(timestamp):
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Return a dictionary with the cache counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+    def discard(self, predicate):
+        """Remove the entries whose key satisfies predicate(key)."""
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+
+_MISSING = object()
+
+# Generation of the cached data, incremented when the data changes (see pipeline_pyrenemofs.refresh).
+# The caches of ttl_cache are keyed by generation: a new generation is built in a background thread, bound to it with
+# building_generation(), while the sessions keep reading the current one until publish_generation() swaps them.
+_GENERATION = [0]
+_LOCAL = threading.local()
+_CACHES = []
+
+
+def current_generation():
+    """Return the generation bound to the current thread, or the published one."""
+    return getattr(_LOCAL, 'generation', None) or _GENERATION[0]
+
+
+@contextmanager
+def building_generation():
+    """Bind the next generation to the current thread, to fill its caches before publishing it."""
+    _LOCAL.generation = _GENERATION[0] + 1
+    try:
+        yield _LOCAL.generation
+    finally:
+        _LOCAL.generation = None
+
+
+def publish_generation(generation):
+    """Make `generation` the current one for all threads, and drop the entries of the older generations."""
+    _GENERATION[0] = generation
+    for cache in _CACHES:
+        cache.discard(lambda key: key[0] < generation)
+
+
+def ttl_cache(maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+    """Decorator caching the results of a function with hashable arguments in a TTLCache, per generation.
+
+    Concurrent calls with the same arguments are computed only once: the other callers wait for the first one,
+    instead of rebuilding the same value when many sessions hit an empty cache at once.
+    As for lru_cache, the decorated function exposes cache_info() and cache_clear().
+    """
+
+    def decorator(func):
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        _CACHES.append(cache)
+        in_flight = {}  # key: threading.Event set when the value is computed
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            key = (current_generation(), args, tuple(sorted(kwargs.items())))
+            while True:
+                value = cache.get(key, _MISSING)
+                if value is not _MISSING:
+                    return value
+                with lock:
+                    event = in_flight.get(key)
+                    leader = event is None
+                    if leader:
+                        event = in_flight[key] = threading.Event()
+                if not leader:
+                    event.wait()  # then read the cache again (or compute, if the leader failed)
+                    continue
+                try:
+                    value = func(*args, **kwargs)
+                    cache.set(key, value)
+                    return value
+                finally:
+                    with lock:
+                        del in_flight[key]
+                    event.set()
+
+        wrapped.cache = cache
+        wrapped.cache_info = cache.stats
+        wrapped.cache_clear = cache.clear
+        return wrapped
+
+    return decorator
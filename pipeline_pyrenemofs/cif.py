@@ -0,0 +1,244 @@
+"""Fast CIF parser, for the cell, the atomic sites and the composition of a structure, without ASE.
+
+The CIF is tokenized in a single pass over its lines, and only the first data block is read. The sites of the
+asymmetric unit are expanded with the symmetry operations of the CIF, if any. Parse a directory of CIFs in parallel:
+
+    python -m pipeline_pyrenemofs.cif pipeline_pyrenemofs/static/orig_cifs [-j 4] [-o cif_info.csv]
+"""
+import argparse
+import glob
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Element symbols, in order of atomic number
+ELEMENTS = (
+    'H', 'He', 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne', 'Na', 'Mg', 'Al', 'Si', 'P', 'S', 'Cl', 'Ar', 'K', 'Ca', 'Sc',
+    'Ti', 'V', 'Cr', 'Mn', 'Fe', 'Co', 'Ni', 'Cu', 'Zn', 'Ga', 'Ge', 'As', 'Se', 'Br', 'Kr', 'Rb', 'Sr', 'Y', 'Zr',
+    'Nb', 'Mo', 'Tc', 'Ru', 'Rh', 'Pd', 'Ag', 'Cd', 'In', 'Sn', 'Sb', 'Te', 'I', 'Xe', 'Cs', 'Ba', 'La', 'Ce', 'Pr',
+    'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt',
+    'Au', 'Hg', 'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn', 'Fr', 'Ra', 'Ac', 'Th', 'Pa', 'U', 'Np', 'Pu', 'Am', 'Cm', 'Bk',
+    'Cf', 'Es', 'Fm', 'Md', 'No', 'Lr')
+ATOMIC_NUMBERS = {symbol: z for z, symbol in enumerate(ELEMENTS, start=1)}
+
+CELL_TAGS = ['_cell_length_a', '_cell_length_b', '_cell_length_c', '_cell_angle_alpha', '_cell_angle_beta',
+             '_cell_angle_gamma']
+FRACT_TAGS = ['_atom_site_fract_x', '_atom_site_fract_y', '_atom_site_fract_z']
+SYMOP_TAGS = ['_symmetry_equiv_pos_as_xyz', '_space_group_symop_operation_xyz']
+
+# Values: quoted strings (the quote must be followed by a blank), or any other sequence of non-blanks
+TOKEN_RE = re.compile(r"""'(.*?)'(?=\s|$)|"(.*?)"(?=\s|$)|(\S+)""")
+SYMBOL_RE = re.compile(r'[A-Z][a-z]?')
+NUMBER_RE = re.compile(r'\(\d+\)$')  # standard uncertainty, e.g. 1.234(5)
+
+
+class CifParsingError(ValueError):
+    pass
+
+
+def tokenize(lines):
+    """Yield the tokens of a CIF as (text, is_value) tuples.
+
+    Quoted strings and semicolon text fields are values; other tokens (tags, loop_, data_) are classified by the parser.
+    """
+    text_field = None
+    for line in lines:
+        if text_field is not None:
+            if line.startswith(';'):
+                yield '\n'.join(text_field), True
+                text_field = None
+            else:
+                text_field.append(line.rstrip('\n'))
+            continue
+        if line.startswith(';'):
+            text_field = [line[1:].rstrip('\n')]
+            continue
+        for single, double, bare in TOKEN_RE.findall(line):
+            if bare:
+                if bare.startswith('#'):
+                    break
+                yield bare, False
+            else:
+                yield single or double, True
+
+
+def parse_tokens(tokens):
+    """Return the items of the first data block as {tag: value}, with a list of values for the looped tags."""
+    items = {}
+    loop_tags, loop_values = None, []
+    tag = None
+    nblocks = 0
+
+    def close_loop():
+        for i, loop_tag in enumerate(loop_tags):
+            items[loop_tag] = loop_values[i::len(loop_tags)]
+
+    for text, is_value in tokens:
+        if not is_value:
+            lower = text.lower()
+            if lower.startswith('data_'):
+                nblocks += 1
+                if nblocks > 1:
+                    break
+                continue
+            if lower == 'loop_':
+                if loop_tags:
+                    close_loop()
+                loop_tags, loop_values = [], []
+                continue
+            if text.startswith('_'):
+                if loop_tags is not None and not loop_values:
+                    loop_tags.append(lower)
+                    continue
+                if loop_tags:
+                    close_loop()
+                    loop_tags = None
+                tag = lower
+                continue
+        if tag is not None:
+            items[tag] = text
+            tag = None
+        elif loop_tags:
+            loop_values.append(text)
+
+    if loop_tags:
+        close_loop()
+    return items
+
+
+def to_float(value):
+    return float(NUMBER_RE.sub('', value))
+
+
+def get_symbol(type_symbol):
+    """Return the element of an atom type or label, e.g., 'Zn' for 'Zn2+' or 'Zn1'."""
+    match = SYMBOL_RE.match(type_symbol.strip().capitalize() if type_symbol[:1].islower() else type_symbol.strip())
+    if match and match.group() in ATOMIC_NUMBERS:
+        return match.group()
+    if match and match.group()[0] in ATOMIC_NUMBERS:
+        return match.group()[0]
+    raise CifParsingError("Unknown element: {}".format(type_symbol))
+
+
+def parse_symop(symop):
+    """Return the rotation matrix and translation vector of a symmetry operation, e.g., '-x+1/2,y,z'."""
+    rotation, translation = np.zeros((3, 3)), np.zeros(3)
+    for i, expression in enumerate(symop.replace(' ', '').lower().split(',')):
+        for sign, term in re.findall(r'([+-]?)([^+-]+)', expression):
+            factor = -1. if sign == '-' else 1.
+            if term in ('x', 'y', 'z'):
+                rotation[i, 'xyz'.index(term)] += factor
+            elif '/' in term:
+                numerator, denominator = term.split('/')
+                translation[i] += factor * float(numerator) / float(denominator)
+            else:
+                translation[i] += factor * float(term)
+    return rotation, translation
+
+
+def expand_sites(symbols, labels, frac_coords, symops, decimals=3):
+    """Apply the symmetry operations to the sites, and remove the duplicates (in fractional coordinates)."""
+    positions = [frac_coords.dot(rotation.T) + translation for rotation, translation in map(parse_symop, symops)]
+    positions = np.concatenate(positions) % 1.
+    site_index = np.tile(np.arange(len(symbols)), len(symops))
+    keys = np.column_stack([site_index, np.round(positions * 10**decimals).astype(int) % 10**decimals])
+    _, unique = np.unique(keys, axis=0, return_index=True)
+    unique = np.sort(unique)
+    return [symbols[i] for i in site_index[unique]], [labels[i] for i in site_index[unique]], positions[unique]
+
+
+def get_formula(symbols):
+    """Return the formula in the Hill notation: C, H, then the other elements alphabetically."""
+    counts = Counter(symbols)
+    first = [s for s in ('C', 'H') if s in counts] if 'C' in counts else []
+    order = first + sorted(s for s in counts if s not in first)
+    return ''.join('{}{}'.format(s, counts[s] if counts[s] > 1 else '') for s in order)
+
+
+def parse_cif(content):
+    """Parse the content (str) of a CIF, and return a dictionary with:
+
+    cell (a, b, c, alpha, beta, gamma), labels, symbols, frac_coords (natoms x 3 array), natoms, formula (Hill),
+    elements (sorted by atomic number), and formula_sum (as reported in the CIF, if any).
+    The sites are those of the full unit cell, if symmetry operations other than the identity are given.
+    """
+    items = parse_tokens(tokenize(content.splitlines()))
+    try:
+        cell = [to_float(items[tag]) for tag in CELL_TAGS]
+        labels = items.get('_atom_site_label') or items['_atom_site_type_symbol']
+        frac_coords = np.array([[to_float(x) for x in items[tag]] for tag in FRACT_TAGS]).T
+    except (KeyError, ValueError) as exc:
+        raise CifParsingError("Missing or invalid cell or atomic sites: {}".format(exc))
+    symbols = [get_symbol(s) for s in items.get('_atom_site_type_symbol', labels)]
+
+    symops = next((items[tag] for tag in SYMOP_TAGS if tag in items), [])
+    if isinstance(symops, str):
+        symops = [symops]
+    if any(parse_symop(symop)[0].tolist() != np.eye(3).tolist() for symop in symops):
+        symbols, labels, frac_coords = expand_sites(symbols, labels, frac_coords, symops)
+
+    return {
+        'cell': cell,
+        'labels': labels,
+        'symbols': symbols,
+        'frac_coords': frac_coords,
+        'natoms': len(symbols),
+        'formula': get_formula(symbols),
+        'elements': sorted(set(symbols), key=ATOMIC_NUMBERS.get),
+        'formula_sum': items.get('_chemical_formula_sum'),
+    }
+
+
+def parse_cif_file(path):
+    with open(path) as handle:
+        return parse_cif(handle.read())
+
+
+def _parse_or_error(path):
+    try:
+        return parse_cif_file(path)
+    except (CifParsingError, OSError, UnicodeDecodeError) as exc:
+        return exc
+
+
+def parse_cif_files(paths, jobs=None):
+    """Parse many CIF files in a process pool. Return a list with the parsed CIFs, or the exceptions."""
+    chunksize = max(1, len(paths) // (4 * (jobs or os.cpu_count())))  # about 4 chunks per process
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_parse_or_error, paths, chunksize=chunksize))
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cif_dir', help="Directory with the <refcode>.cif files.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of processes.")
+    parser.add_argument('-o', '--output', help="Write the cell, formula and elements of each CIF to this CSV file.")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.cif_dir, '*.cif')))
+    start = time.perf_counter()
+    results = parse_cif_files(paths, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    rows = []
+    for path, result in zip(paths, results):
+        refcode = os.path.splitext(os.path.basename(path))[0]
+        if isinstance(result, Exception):
+            print("{}: FAILED ({})".format(refcode, result))
+            continue
+        rows.append([refcode] + result['cell'] + [result['natoms'], result['formula'], ', '.join(result['elements'])])
+    print("{} CIFs parsed in {:.2f} s ({} failed)".format(len(paths), elapsed, len(paths) - len(rows)))
+
+    if args.output:
+        columns = ['refcode', 'a', 'b', 'c', 'alpha', 'beta', 'gamma', 'natoms', 'formula', 'elements']
+        pd.DataFrame(rows, columns=columns).to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Content-addressed store of CIF files.
+
+CIFs are deduplicated by their SHA-256 and packed in a single blob file, which is read through a memory map:
+
+    <store>/cifs.pack   concatenated CIF contents
+    <store>/index.json  {"version": 1, "blobs": {sha256: [offset, length]}, "refs": {refcode: {tag: sha256}}}
+
+Build or extend the store, e.g., from the original CIFs shipped with the repository:
+
+    python -m pipeline_pyrenemofs.cifstore pipeline_pyrenemofs/static/orig_cifs --tag orig_cif
+"""
+import argparse
+import glob
+import hashlib
+import json
+import mmap
+import os
+from os.path import join
+
+from pipeline_pyrenemofs import CONFIG_DIR
+from pipeline_pyrenemofs.cache import ttl_cache
+
+CIF_STORE_VERSION = 1
+CIF_STORE_DIR = os.getenv('PYRENEMOFS_CIF_STORE', join(CONFIG_DIR, 'cifstore'))
+PACK_FILENAME = 'cifs.pack'
+INDEX_FILENAME = 'index.json'
+
+
+def _read_index(path):
+    index_path = join(path, INDEX_FILENAME)
+    if not os.path.isfile(index_path):
+        return {'version': CIF_STORE_VERSION, 'blobs': {}, 'refs': {}}
+    with open(index_path) as handle:
+        index = json.load(handle)
+    if index.get('version') != CIF_STORE_VERSION:
+        raise ValueError("CIF store {} has version {}, expected {}: rebuild it.".format(
+            path, index.get('version'), CIF_STORE_VERSION))
+    return index
+
+
+class CifStore():
+    """Read-only access to a CIF store: blobs are memoryview slices of the memory-mapped pack file."""
+
+    def __init__(self, path=CIF_STORE_DIR):
+        self.path = path
+        self.index = _read_index(path)
+        self._mmap = None
+        pack_path = join(path, PACK_FILENAME)
+        if os.path.isfile(pack_path) and os.path.getsize(pack_path) > 0:
+            with open(pack_path, 'rb') as handle:
+                self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __contains__(self, sha256):
+        return sha256 in self.index['blobs']
+
+    def get_sha256(self, refcode, tag):
+        """Return the SHA-256 of the CIF of a material with a given tag (e.g., 'orig_cif', 'opt_cif_ddec')."""
+        return self.index['refs'][refcode][tag]
+
+    def get_blob(self, sha256):
+        """Return the content of a CIF as a memoryview, without copying it."""
+        offset, length = self.index['blobs'][sha256]
+        return memoryview(self._mmap)[offset:offset + length]
+
+    def get(self, refcode, tag):
+        return self.get_blob(self.get_sha256(refcode, tag))
+
+    def get_text(self, sha256):
+        return str(self.get_blob(sha256), 'utf-8')
+
+    def refs(self, tag=None):
+        """Iterate over (refcode, tag, sha256), optionally only for one tag."""
+        for refcode, tags in sorted(self.index['refs'].items()):
+            for ref_tag, sha256 in sorted(tags.items()):
+                if tag is None or ref_tag == tag:
+                    yield refcode, ref_tag, sha256
+
+
+class CifStoreWriter():
+    """Add CIFs to a store: new contents are appended to the pack file, duplicated ones are only referenced.
+
+    The index is written atomically on close, so that readers never see blobs that are not yet written.
+    """
+
+    def __init__(self, path=CIF_STORE_DIR):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.index = _read_index(path)
+        self._pack = open(join(path, PACK_FILENAME), 'ab')
+
+    def add(self, content, refcode=None, tag=None):
+        """Add the content of a CIF (bytes or str), referenced by refcode and tag if given. Return its SHA-256."""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        sha256 = hashlib.sha256(content).hexdigest()
+        if sha256 not in self.index['blobs']:
+            self.index['blobs'][sha256] = [self._pack.tell(), len(content)]
+            self._pack.write(content)
+        if refcode is not None:
+            self.index['refs'].setdefault(refcode, {})[tag] = sha256
+        return sha256
+
+    def close(self):
+        self._pack.close()
+        index_path = join(self.path, INDEX_FILENAME)
+        with open(index_path + '.tmp', 'w') as handle:
+            json.dump(self.index, handle)
+        os.replace(index_path + '.tmp', index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@ttl_cache(ttl=None)
+def get_cif_store():
+    """Return the CifStore in CIF_STORE_DIR, or None if it was not built."""
+    if not os.path.isfile(join(CIF_STORE_DIR, INDEX_FILENAME)):
+        return None
+    return CifStore(CIF_STORE_DIR)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cif_dir', help="Directory with <refcode>.cif files to add to the store.")
+    parser.add_argument('--tag', default='orig_cif', help="Tag of the added CIFs.")
+    parser.add_argument('--store', default=CIF_STORE_DIR, help="Path of the store.")
+    args = parser.parse_args()
+
+    with CifStoreWriter(args.store) as writer:
+        for path in sorted(glob.glob(join(args.cif_dir, '*.cif'))):
+            refcode = os.path.splitext(os.path.basename(path))[0]
+            with open(path, 'rb') as handle:
+                writer.add(handle.read(), refcode=refcode, tag=args.tag)
+        print("{} CIFs ({} unique) in {}".format(sum(len(tags) for tags in writer.index['refs'].values()),
+                                                 len(writer.index['blobs']), args.store))
+
+
+if __name__ == '__main__':
+    main()
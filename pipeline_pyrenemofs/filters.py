@@ -0,0 +1,63 @@
+"""Range filters over the quantities of the property table.
+
+Each column is sorted once per data generation: a range is then resolved with two binary searches, and a combination of
+ranges with the intersection of the masks of their rows.
+"""
+import numpy as np
+
+from pipeline_pyrenemofs import get_property_table
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.metrics import timed
+from pipeline_pyrenemofs.similarity import get_feature_ids
+
+
+class SortedColumns():
+    """Presorted columns of a table: the order of the rows with a value (NaN excluded), and their sorted values."""
+
+    def __init__(self, table, column_ids):
+        self.nrows = len(table)
+        self.orders, self.values = {}, {}
+        for column_id in column_ids:
+            column = table[column_id].to_numpy(dtype=np.float64)
+            order = np.argsort(column, kind='mergesort')  # NaN last
+            order = order[:np.count_nonzero(~np.isnan(column))]
+            self.orders[column_id] = order
+            self.values[column_id] = column[order]
+
+    def bounds(self, column_id):
+        """Return the minimum and maximum values of a column."""
+        values = self.values[column_id]
+        return (float(values[0]), float(values[-1])) if len(values) else (np.nan, np.nan)
+
+    def range_rows(self, column_id, low, high):
+        """Return the rows with low <= value <= high, in the order of their values."""
+        values = self.values[column_id]
+        return self.orders[column_id][np.searchsorted(values, low, 'left'):np.searchsorted(values, high, 'right')]
+
+    def filter(self, ranges):
+        """Return the sorted rows within all the ranges {column_id: (low, high)}.
+
+        The ranges covering all the values of their column are ignored, so that the rows without a value are kept.
+        """
+        mask = None
+        for column_id, (low, high) in ranges.items():
+            min_value, max_value = self.bounds(column_id)
+            if low <= min_value and high >= max_value:
+                continue
+            column_mask = np.zeros(self.nrows, dtype=bool)
+            column_mask[self.range_rows(column_id, low, high)] = True
+            mask = column_mask if mask is None else np.logical_and(mask, column_mask, out=mask)
+        return np.arange(self.nrows) if mask is None else np.flatnonzero(mask)
+
+
+@timed
+@ttl_cache(ttl=None)
+def get_sorted_columns():
+    """Return the SortedColumns of the quantities of the property table, shared by all the sessions."""
+    return SortedColumns(get_property_table(), get_feature_ids())
+
+
+@timed
+def filter_materials(ranges):
+    """Return the positions in the property table of the materials within all the ranges {quantity id: (low, high)}."""
+    return get_sorted_columns().filter(ranges)
@@ -0,0 +1,262 @@
+"""Fast approximate pore geometry of a periodic structure, from its CIF, to screen structures before running zeo++.
+
+The distances from the points of a grid in the unit cell to the nearest atomic surface are computed with a KD-tree over
+the atoms and their periodic images. They give the density, the void fractions, the largest included and free spheres
+and a pore size histogram; the accessible surface is sampled on the spheres around the atoms. The results use the keys
+of the zeo++ Dicts (orig_zeopp, opt_zeopp), so that they can be compared with the quantities of the apps:
+
+    python -m pipeline_pyrenemofs.geometry pipeline_pyrenemofs/static/orig_cifs [-j 4] [-o geometry.csv]
+
+Differences with zeo++: the pockets that are not accessible are counted in the accessible volume and surface, and the
+pore size histogram is the distribution of the distances to the surface (not of the largest spheres containing the
+points).
+"""
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from pipeline_pyrenemofs.cif import ATOMIC_NUMBERS, parse_cif, parse_cif_file
+
+# Standard atomic weights (amu), in order of atomic number
+ATOMIC_MASSES = (
+    1.008, 4.003, 6.94, 9.012, 10.81, 12.011, 14.007, 15.999, 18.998, 20.180, 22.990, 24.305, 26.982, 28.085, 30.974,
+    32.06, 35.45, 39.948, 39.098, 40.078, 44.956, 47.867, 50.942, 51.996, 54.938, 55.845, 58.933, 58.693, 63.546, 65.38,
+    69.723, 72.630, 74.922, 78.971, 79.904, 83.798, 85.468, 87.62, 88.906, 91.224, 92.906, 95.95, 97.907, 101.07,
+    102.906, 106.42, 107.868, 112.414, 114.818, 118.710, 121.760, 127.60, 126.904, 131.293, 132.905, 137.327, 138.905,
+    140.116, 140.908, 144.242, 144.913, 150.36, 151.964, 157.25, 158.925, 162.500, 164.930, 167.259, 168.934, 173.045,
+    174.967, 178.49, 180.948, 183.84, 186.207, 190.23, 192.217, 195.084, 196.967, 200.592, 204.38, 207.2, 208.980,
+    208.982, 209.987, 222.018, 223.020, 226.025, 227.028, 232.038, 231.036, 238.029, 237.048, 244.064, 243.061,
+    247.070, 247.070, 251.080, 252.083, 257.095, 258.098, 259.101, 262.110)
+
+# Van der Waals radii (Angstrom) of the CCDC, DEFAULT_RADIUS for the other elements
+RADII = {
+    'H': 1.09, 'He': 1.40, 'Li': 1.82, 'B': 1.92, 'C': 1.70, 'N': 1.55, 'O': 1.52, 'F': 1.47, 'Na': 2.27, 'Mg': 1.73,
+    'Al': 1.84, 'Si': 2.10, 'P': 1.80, 'S': 1.80, 'Cl': 1.75, 'K': 2.75, 'Ni': 1.63, 'Cu': 1.40, 'Zn': 1.39,
+    'Ga': 1.87, 'Ge': 2.11, 'As': 1.85, 'Se': 1.90, 'Br': 1.85, 'Pd': 1.63, 'Ag': 1.72, 'Cd': 1.58, 'In': 1.93,
+    'Sn': 2.17, 'Sb': 2.06, 'Te': 2.06, 'I': 1.98, 'Pt': 1.75, 'Au': 1.66, 'Hg': 1.55, 'Tl': 1.96, 'Pb': 2.02,
+    'Bi': 2.07, 'U': 1.86
+}
+DEFAULT_RADIUS = 2.0
+
+PROBE_RADIUS = 1.86  # N2, as for the accessible quantities of zeo++
+GRID_SPACING = 0.5  # Angstrom
+CUTOFF = 15.0  # Angstrom, largest distance to the surface that is resolved
+SURFACE_SAMPLES = 100  # points per atom
+PSD_BIN_WIDTH = 0.5  # Angstrom
+
+AMU_TO_G = 1.66054e-24
+CHUNK_SIZE = 100000  # grid points per KD-tree query
+
+
+def get_cell_matrix(a, b, c, alpha, beta, gamma):
+    """Return the cell vectors (rows), with a along x and b in the xy plane."""
+    alpha, beta, gamma = np.radians([alpha, beta, gamma])
+    cos_a, cos_b, cos_g, sin_g = np.cos(alpha), np.cos(beta), np.cos(gamma), np.sin(gamma)
+    cx = c * cos_b
+    cy = c * (cos_a - cos_b * cos_g) / sin_g
+    return np.array([[a, 0., 0.], [b * cos_g, b * sin_g, 0.], [cx, cy, np.sqrt(c**2 - cx**2 - cy**2)]])
+
+
+def get_plane_spacings(cell):
+    """Return the distances between the lattice planes parallel to the faces of the cell."""
+    volume = abs(np.linalg.det(cell))
+    return volume / np.linalg.norm(np.cross(cell[[1, 2, 0]], cell[[2, 0, 1]]), axis=1)
+
+
+def periodic_images(frac_coords, cell, margin):
+    """Return the indices and cartesian positions of the sites and their images within margin of the unit cell."""
+    frac_margin = margin / get_plane_spacings(cell)
+    nimages = np.ceil(frac_margin).astype(int)
+    shifts = np.array(np.meshgrid(*[np.arange(-n, n + 1) for n in nimages], indexing='ij')).reshape(3, -1).T
+
+    frac_coords = frac_coords % 1.
+    images = (frac_coords[None, :, :] + shifts[:, None, :]).reshape(-1, 3)
+    indices = np.tile(np.arange(len(frac_coords)), len(shifts))
+    inside = np.all((images >= -frac_margin) & (images < 1. + frac_margin), axis=1)
+    return indices[inside], images[inside].dot(cell)
+
+
+def get_grid(cell, spacing):
+    """Return the shape of the grid and the cartesian coordinates of its points (at the centers of the voxels)."""
+    shape = np.maximum(1, np.ceil(np.linalg.norm(cell, axis=1) / spacing).astype(int))
+    axes = [(np.arange(n) + 0.5) / n for n in shape]
+    frac = np.array(np.meshgrid(*axes, indexing='ij')).reshape(3, -1).T
+    return tuple(shape), frac.dot(cell)
+
+
+def surface_distances(tree, radii, points, cutoff, k=16):
+    """Return the distance of each point to the nearest atomic surface (negative inside the atoms), up to cutoff."""
+    k = min(k, tree.n)
+    result = np.empty(len(points))
+    for start in range(0, len(points), CHUNK_SIZE):
+        dist, index = tree.query(points[start:start + CHUNK_SIZE], k=k, distance_upper_bound=cutoff + radii.max())
+        dist = dist.reshape(len(dist), k)
+        index = index.reshape(len(index), k)
+        found = index < tree.n
+        surface = np.where(found, dist - radii[np.minimum(index, tree.n - 1)], np.inf)
+        result[start:start + CHUNK_SIZE] = np.minimum(surface.min(axis=1), cutoff)
+    return result
+
+
+def percolates(mask):
+    """Return True if the True voxels of a periodic grid form a channel along any axis."""
+    from scipy import ndimage
+
+    for axis in range(3):
+        labels, _ = ndimage.label(np.concatenate([mask] * 3, axis=axis))
+        first, last = np.take(labels, 0, axis=axis), np.take(labels, -1, axis=axis)
+        if np.intersect1d(first[first > 0], last[last > 0]).size:
+            return True
+    return False
+
+
+def largest_free_radius(distances, tol=0.05):
+    """Return the largest radius of a sphere that can travel through the grid, by bisection."""
+    low, high = 0., distances.max()
+    if high <= 0. or not percolates(distances >= low):
+        return 0.
+    while high - low > tol:
+        middle = (low + high) / 2.
+        low, high = (middle, high) if percolates(distances >= middle) else (low, middle)
+    return low
+
+
+def sphere_points(npoints):
+    """Return npoints unit vectors spread on the sphere (golden spiral)."""
+    index = np.arange(npoints) + 0.5
+    polar = np.arccos(1. - 2. * index / npoints)
+    azimuth = np.pi * (1. + 5**0.5) * index
+    return np.column_stack([np.cos(azimuth) * np.sin(polar), np.sin(azimuth) * np.sin(polar), np.cos(polar)])
+
+
+def accessible_area(tree, radii, positions, site_radii, probe_radius, nsamples):
+    """Return the area (A^2) of the surface that the center of the probe can reach, sampled around the sites.
+
+    tree and radii are those of the sites and their periodic images, positions and site_radii those of the sites.
+    """
+    directions = sphere_points(nsamples)
+    spheres = site_radii + probe_radius
+    points = (positions[:, None, :] + spheres[:, None, None] * directions[None, :, :]).reshape(-1, 3)
+    accessible = surface_distances(tree, radii, points, cutoff=probe_radius) >= probe_radius - 1e-6
+    fractions = accessible.reshape(len(positions), nsamples).mean(axis=1)
+    return float(np.sum(4. * np.pi * spheres**2 * fractions))
+
+
+def compute_geometry(structure,
+                     probe_radius=PROBE_RADIUS,
+                     spacing=GRID_SPACING,
+                     cutoff=CUTOFF,
+                     surface_samples=SURFACE_SAMPLES,
+                     psd_bin_width=PSD_BIN_WIDTH):
+    """Return the geometric properties of a structure, parsed with pipeline_pyrenemofs.cif.parse_cif.
+
+    The keys are those of the zeo++ Dicts: Density (g/cm^3), AV_Volume_fraction and AV_cm^3/g (probe of radius 0),
+    POAV_Volume_fraction and POAV_cm^3/g, ASA_A^2 and ASA_m^2/g (probe of probe_radius), Largest_included_sphere and
+    Largest_free_sphere (diameters, Angstrom). NASA_m^2/g and PONAV_cm^3/g are 0: the pockets that are not accessible
+    are counted as accessible. The pore size histogram is in psd: {'diameter': [...], 'fraction': [...]}.
+    """
+    from scipy.spatial import cKDTree
+
+    cell = get_cell_matrix(*structure['cell'])
+    volume = abs(np.linalg.det(cell))
+    numbers = np.array([ATOMIC_NUMBERS[symbol] for symbol in structure['symbols']])
+    mass = float(np.sum(np.array(ATOMIC_MASSES)[numbers - 1]))
+    density = float(mass * AMU_TO_G / (volume * 1e-24))
+
+    site_radii = np.array([RADII.get(symbol, DEFAULT_RADIUS) for symbol in structure['symbols']])
+    indices, images = periodic_images(structure['frac_coords'], cell, margin=cutoff + site_radii.max())
+    tree, radii = cKDTree(images), site_radii[indices]
+
+    shape, points = get_grid(cell, spacing)
+    distances = surface_distances(tree, radii, points, cutoff)
+
+    # Accessible volume: the points within probe_radius of a possible center of the probe
+    centers = points[distances >= probe_radius]
+    if len(centers):
+        center_frac = np.linalg.solve(cell.T, centers.T).T
+        _, center_images = periodic_images(center_frac, cell, margin=probe_radius)
+        covered = cKDTree(center_images).query(points, k=1, distance_upper_bound=probe_radius)[0] <= probe_radius
+        poav_fraction = float(covered.mean())
+    else:
+        poav_fraction = 0.
+    av_fraction = float(np.mean(distances > 0.))
+
+    positions = (structure['frac_coords'] % 1.).dot(cell)
+    asa = accessible_area(tree, radii, positions, site_radii, probe_radius, surface_samples)
+
+    pore_diameters = 2. * distances[distances > 0.]
+    bins = np.arange(0., 2. * cutoff + psd_bin_width, psd_bin_width)
+    counts, _ = np.histogram(pore_diameters, bins=bins)
+
+    return {
+        'Density': density,
+        'AV_Volume_fraction': av_fraction,
+        'AV_cm^3/g': av_fraction / density,
+        'POAV_Volume_fraction': poav_fraction,
+        'POAV_cm^3/g': poav_fraction / density,
+        'ASA_A^2': asa,
+        'ASA_m^2/g': asa * 1e-20 / (mass * AMU_TO_G),
+        'NASA_m^2/g': 0.,
+        'PONAV_cm^3/g': 0.,
+        'Largest_included_sphere': 2. * max(float(distances.max()), 0.),
+        'Largest_free_sphere': 2. * float(largest_free_radius(distances.reshape(shape))),
+        'psd': {
+            'diameter': ((bins[:-1] + bins[1:]) / 2.).tolist(),
+            'fraction': (counts / max(1, len(distances))).tolist(),
+        },
+    }
+
+
+def compute_geometry_cif(content, **kwargs):
+    """Return the geometric properties of the structure in the content (str) of a CIF."""
+    return compute_geometry(parse_cif(content), **kwargs)
+
+
+def _compute_or_error(path, kwargs):
+    try:
+        return compute_geometry(parse_cif_file(path), **kwargs)
+    except (ValueError, KeyError, OSError) as exc:
+        return exc
+
+
+def compute_geometry_files(paths, jobs=None, **kwargs):
+    """Compute the geometry of many CIF files in a process pool. Return a list with the results, or the exceptions."""
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(_compute_or_error, paths, [kwargs] * len(paths)))
+
+
+def main():
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cif_dir', help="Directory with the <refcode>.cif files.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of processes.")
+    parser.add_argument('-o', '--output', help="Write the properties of each CIF to this CSV file.")
+    parser.add_argument('--probe-radius', type=float, default=PROBE_RADIUS, help="Radius of the probe (Angstrom).")
+    parser.add_argument('--spacing', type=float, default=GRID_SPACING, help="Spacing of the grid (Angstrom).")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.cif_dir, '*.cif')))
+    start = time.perf_counter()
+    results = compute_geometry_files(paths, args.jobs, probe_radius=args.probe_radius, spacing=args.spacing)
+    elapsed = time.perf_counter() - start
+
+    rows = {}
+    for path, result in zip(paths, results):
+        refcode = os.path.splitext(os.path.basename(path))[0]
+        if isinstance(result, Exception):
+            print("{}: FAILED ({})".format(refcode, result))
+            continue
+        rows[refcode] = {key: value for key, value in result.items() if key != 'psd'}
+    print("{} structures in {:.1f} s ({} failed)".format(len(paths), elapsed, len(paths) - len(rows)))
+
+    if args.output:
+        pd.DataFrame.from_dict(rows, orient='index').rename_axis('refcode').to_csv(args.output)
+
+
+if __name__ == '__main__':
+    main()
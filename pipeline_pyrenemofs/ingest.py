@@ -0,0 +1,181 @@
+"""Ingest the original CIFs and the info CSV into an AiiDA profile, e.g., to stand up a local dev or benchmark instance.
+
+For each material of the info CSV, a CifData is created from <cif_dir>/<refcode>.cif, with the tag4 extras used by the
+apps, and added to a new group curated-mof_<refcode>_v1. Unless --no-geometry, its geometric properties are approximated
+with pipeline_pyrenemofs.geometry, and stored in an orig_zeopp Dict of the group, so that the material is shown in the
+figure:
+
+    python -m pipeline_pyrenemofs.ingest [--cif-dir DIR] [--info-csv CSV] [-j 4] [--batch-size 50] [--no-geometry]
+
+The CIFs are parsed in a process pool, and the nodes are stored in batches, one storage transaction per batch.
+The ingested refcodes are recorded in a checkpoint file after each batch: reruns only ingest the missing materials.
+The refcodes without a CIF are skipped, and listed at the end (with a non-zero exit status).
+"""
+import argparse
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os.path import join
+
+from pipeline_pyrenemofs import CONFIG_DIR, GROUP_DIR, INFO_CSV, TAG_KEY, load_profile
+
+CIF_DIR = join(CONFIG_DIR, 'orig_cifs')
+WORKFLOW_VERSION = 1
+CHECKPOINT_FILENAME = 'ingest_checkpoint.json'
+
+SPACEGROUP_TAGS = ['_space_group.it_number', '_space_group_it_number', '_symmetry_int_tables_number']
+
+
+def _to_int(value):
+    """Return the space group number as an int, as stored by CifData.parse(), or None if missing or unknown ('?')."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_geometry(path, content):
+    """Return the approximate zeo++ properties of a CIF (see pipeline_pyrenemofs.geometry), or None if they fail."""
+    from pipeline_pyrenemofs.geometry import compute_geometry_cif
+
+    try:
+        return compute_geometry_cif(content.decode('utf-8'))
+    except (ValueError, KeyError) as exc:
+        print("{}: geometry FAILED ({})".format(path, exc))
+        return None
+
+
+def parse_cif(path, geometry=True):
+    """Read and parse a CIF file, returning its content with the attributes set by CifData.parse(), and optionally its
+    geometric properties.
+
+    Run in the worker processes, so that the main process only stores the nodes.
+    """
+    from CifFile import ReadCif  # PyCifRW, as used by CifData
+
+    with open(path, 'rb') as handle:
+        content = handle.read()
+    values = ReadCif(io.StringIO(content.decode('utf-8')), scantype='flex')
+    return {
+        'content': content,
+        'geometry': get_geometry(path, content) if geometry else None,
+        'formulae': [values[block].get('_chemical_formula_sum') for block in values.keys()],
+        'spacegroup_numbers': [
+            _to_int(next((values[block][tag] for tag in SPACEGROUP_TAGS if tag in values[block]), None))
+            for block in values.keys()
+        ],
+    }
+
+
+def read_checkpoint(path):
+    """Return {refcode: uuid} of the ingested materials (uuid is None if found in the database but not recorded)."""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def write_checkpoint(checkpoint, path):
+    with open(path + '.tmp', 'w') as handle:
+        json.dump(checkpoint, handle, indent=1, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def get_group_label(refcode):
+    return '{}_{}_v{}'.format(GROUP_DIR, refcode, WORKFLOW_VERSION)
+
+
+def store_batch(batch):
+    """Store the CifData nodes and the groups of a batch of (info row, parsed CIF), in one transaction.
+
+    Returns {refcode: uuid}.
+    """
+    from aiida.manage import get_manager
+    from aiida.orm import CifData, Dict, Group
+
+    stored = {}
+    with get_manager().get_profile_storage().transaction():
+        for row, parsed in batch:
+            node = CifData(file=io.BytesIO(parsed['content']), filename='{}.cif'.format(row['refcode']),
+                           parse_policy='lazy')
+            node.label = row['refcode']
+            node.base.attributes.set('formulae', parsed['formulae'])
+            node.base.attributes.set('spacegroup_numbers', parsed['spacegroup_numbers'])
+            node.store()
+            node.base.extras.set_many({
+                TAG_KEY: 'orig_cif',
+                'name_conventional': row['name'],
+                'doi_ref': row['DOI'],
+                'class_material': 'mof',
+                'workflow_version': WORKFLOW_VERSION,
+            })
+            nodes = [node]
+            if parsed['geometry'] is not None:
+                zeopp = Dict(parsed['geometry']).store()
+                zeopp.base.extras.set_many({TAG_KEY: 'orig_zeopp', 'method': 'pipeline_pyrenemofs.geometry'})
+                nodes.append(zeopp)
+            group = Group(label=get_group_label(row['refcode'])).store()
+            group.add_nodes(nodes)
+            stored[row['refcode']] = node.uuid
+    return stored
+
+
+def existing_groups(refcodes):
+    """Return the refcodes whose group already exists, e.g., if a run stopped before writing the checkpoint."""
+    from aiida.orm import Group, QueryBuilder
+
+    labels = {get_group_label(refcode): refcode for refcode in refcodes}
+    qb = QueryBuilder().append(Group, filters={'label': {'in': list(labels)}}, project=['label'])
+    return {labels[label] for label in qb.all(flat=True)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cif-dir', default=CIF_DIR, help="Directory with the <refcode>.cif files.")
+    parser.add_argument('--info-csv', default=INFO_CSV, help="Info CSV, with refcode, name and DOI columns.")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help="Number of parsing processes.")
+    parser.add_argument('--batch-size', type=int, default=50, help="Number of materials stored per transaction.")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILENAME, help="Checkpoint file of the ingested refcodes.")
+    parser.add_argument('--no-geometry', action='store_true', help="Do not compute the geometric properties.")
+    args = parser.parse_args()
+
+    import pandas as pd
+    load_profile()
+
+    checkpoint = read_checkpoint(args.checkpoint)
+    rows, missing = [], []
+    for row in pd.read_csv(args.info_csv).to_dict('records'):
+        if row['refcode'] in checkpoint:
+            continue
+        if not os.path.isfile(join(args.cif_dir, '{}.cif'.format(row['refcode']))):
+            print("{}: MISSING CIF, skipped".format(row['refcode']))
+            missing.append(row['refcode'])
+            continue
+        rows.append(row)
+    print("{} materials to ingest ({} already in the checkpoint)".format(len(rows), len(checkpoint)))
+
+    with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        # The CIFs are parsed ahead, while the previous batches are stored
+        paths = [join(args.cif_dir, '{}.cif'.format(row['refcode'])) for row in rows]
+        parsed_cifs = executor.map(partial(parse_cif, geometry=not args.no_geometry),
+                                   paths,
+                                   chunksize=max(1, args.batch_size // args.jobs))
+
+        for start in range(0, len(rows), args.batch_size):
+            batch = list(zip(rows[start:start + args.batch_size], itertools.islice(parsed_cifs, args.batch_size)))
+            done = existing_groups([row['refcode'] for row, _ in batch])
+            checkpoint.update({refcode: None for refcode in done})
+            checkpoint.update(store_batch([(row, parsed) for row, parsed in batch if row['refcode'] not in done]))
+            write_checkpoint(checkpoint, args.checkpoint)
+            print("{} materials ingested".format(len(checkpoint)))
+
+    if missing:  # the apps only show the materials ingested
+        raise SystemExit("{} materials of {} skipped, without <refcode>.cif in {}: {}".format(
+            len(missing), args.info_csv, args.cif_dir, ', '.join(missing)))
+
+
+if __name__ == '__main__':
+    main()
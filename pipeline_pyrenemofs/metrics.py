@@ -0,0 +1,225 @@
+"""Lightweight instrumentation of the data functions and of the page builders.
+
+Functions decorated with @timed record their number of calls and wall time, process-wide and for the current session,
+together with the cache hits of cached functions and the SQL queries issued by AiiDA (counted with a SQLAlchemy event).
+
+The process-wide counters are exposed in the Prometheus text format at <prefix>/metrics (see pipeline_pyrenemofs.serve).
+With several server processes, each one answers with its own counters: the series are labelled with the pid, to be
+summed over the processes by the monitoring.
+Set PYRENEMOFS_SESSION_LOG=1 to log one line per session, with its calls, queries and document size, when it closes.
+The document sizes are only measured (and pyrenemofs_session_payload_bytes_total exported) with the session log.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+SESSION_LOG = os.getenv('PYRENEMOFS_SESSION_LOG', '0').lower() in ('1', 'true', 'yes')
+
+LOGGER = logging.getLogger(__name__)
+
+_LOCK = threading.Lock()
+_LOCAL = threading.local()  # .session: SessionStats of the session being served by the current thread
+
+
+class Stats():
+    """Counters of calls, cache hits and SQL queries."""
+
+    def __init__(self):
+        self.calls = OrderedDict()  # name: [count, total seconds, max seconds, cache hits]
+        self.sql_queries = 0
+
+    def add_call(self, name, seconds, cache_hit):
+        with _LOCK:
+            record = self.calls.setdefault(name, [0, 0., 0., 0])
+            record[0] += 1
+            record[1] += seconds
+            record[2] = max(record[2], seconds)
+            record[3] += int(cache_hit)
+
+    def add_sql_query(self):
+        with _LOCK:
+            self.sql_queries += 1
+
+
+class SessionStats(Stats):
+    """Counters of one Bokeh session."""
+
+    def __init__(self, app, session_id):
+        super().__init__()
+        self.app = app
+        self.session_id = session_id
+        self.started = time.time()
+        self.payload_bytes = None
+
+    def to_dict(self):
+        with _LOCK:
+            return {
+                'app': self.app,
+                'session_id': self.session_id,
+                'duration_s': round(time.time() - self.started, 3),
+                'sql_queries': self.sql_queries,
+                'payload_bytes': self.payload_bytes,
+                'calls': {name: {
+                    'count': count,
+                    'seconds': round(seconds, 4),
+                    'cache_hits': hits
+                } for name, (count, seconds, _, hits) in self.calls.items()},
+            }
+
+
+PROCESS_STATS = Stats()
+SESSION_COUNTS = OrderedDict()  # app: [sessions, total payload bytes]
+_CACHED_FUNCTIONS = OrderedDict()  # name: function exposing cache_info()
+
+
+def current_session():
+    """Return the SessionStats bound to the current thread, or None."""
+    return getattr(_LOCAL, 'session', None)
+
+
+@contextmanager
+def session_scope(stats):
+    """Record the calls made in this block into the stats of a session."""
+    previous = current_session()
+    _LOCAL.session = stats
+    try:
+        yield stats
+    finally:
+        _LOCAL.session = previous
+
+
+def bind_session(func, stats=None):
+    """Return func, recording its calls into the current session (or stats) when run in another thread."""
+    stats = stats or current_session()
+    if stats is None:
+        return func
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        with session_scope(stats):
+            return func(*args, **kwargs)
+
+    return wrapped
+
+
+def _cache_misses(func):
+    info = func.cache_info()
+    return info['misses'] if isinstance(info, dict) else info.misses
+
+
+def timed(func):
+    """Decorator recording the calls and wall time of a function, and the cache hits if cached.
+
+    Cache hits are detected from the miss counter of the cache, so they are approximate with concurrent calls.
+    The cache_info and cache_clear methods of cached functions are kept.
+    """
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+    cached = hasattr(func, 'cache_info')
+    if cached:
+        _CACHED_FUNCTIONS[name] = func
+
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        misses = _cache_misses(func) if cached else None
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            cache_hit = cached and _cache_misses(func) == misses
+            PROCESS_STATS.add_call(name, seconds, cache_hit)
+            session = current_session()
+            if session is not None:
+                session.add_call(name, seconds, cache_hit)
+
+    for attr in ['cache', 'cache_info', 'cache_clear']:
+        if hasattr(func, attr):
+            setattr(wrapped, attr, getattr(func, attr))
+    return wrapped
+
+
+def _count_sql_query(*args, **kwargs):  # pylint: disable=unused-argument
+    PROCESS_STATS.add_sql_query()
+    session = current_session()
+    if session is not None:
+        session.add_sql_query()
+
+
+_SQL_LISTENER = []
+
+
+def install_sql_counter():
+    """Count the SQL queries of all the SQLAlchemy engines (once per process)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with _LOCK:
+        if not _SQL_LISTENER:
+            event.listen(Engine, 'before_cursor_execute', _count_sql_query)
+            _SQL_LISTENER.append(_count_sql_query)
+
+
+def track_session(doc, app):
+    """Create the SessionStats of a Bokeh document, to be filled within session_scope().
+
+    The session is counted when destroyed and, if SESSION_LOG is set, logged with the size of its document.
+    """
+    session_id = doc.session_context.id if doc.session_context is not None else None
+    stats = SessionStats(app, session_id)
+
+    def session_destroyed(session_context):  # pylint: disable=unused-argument
+        if SESSION_LOG:
+            stats.payload_bytes = len(doc.to_json_string())
+        with _LOCK:
+            counts = SESSION_COUNTS.setdefault(app, [0, 0])
+            counts[0] += 1
+            counts[1] += stats.payload_bytes or 0
+        if SESSION_LOG:
+            LOGGER.info("session %s", json.dumps(stats.to_dict()))
+
+    if doc.session_context is not None:
+        doc.on_session_destroyed(session_destroyed)
+    return stats
+
+
+def format_metrics():
+    """Return the process-wide counters in the Prometheus text format."""
+    pid = os.getpid()  # not cached: the server processes are forked
+    lines = [
+        '# TYPE pyrenemofs_calls_total counter',
+        '# TYPE pyrenemofs_call_seconds_total counter',
+        '# TYPE pyrenemofs_call_seconds_max gauge',
+        '# TYPE pyrenemofs_call_cache_hits_total counter',
+    ]
+    with _LOCK:
+        for name, (count, seconds, max_seconds, hits) in PROCESS_STATS.calls.items():
+            labels = 'function="{}",pid="{}"'.format(name, pid)
+            lines.append('pyrenemofs_calls_total{{{}}} {}'.format(labels, count))
+            lines.append('pyrenemofs_call_seconds_total{{{}}} {:.6f}'.format(labels, seconds))
+            lines.append('pyrenemofs_call_seconds_max{{{}}} {:.6f}'.format(labels, max_seconds))
+            lines.append('pyrenemofs_call_cache_hits_total{{{}}} {}'.format(labels, hits))
+
+        lines.append('# TYPE pyrenemofs_sql_queries_total counter')
+        lines.append('pyrenemofs_sql_queries_total{{pid="{}"}} {}'.format(pid, PROCESS_STATS.sql_queries))
+
+        lines.append('# TYPE pyrenemofs_sessions_total counter')
+        if SESSION_LOG:
+            lines.append('# TYPE pyrenemofs_session_payload_bytes_total counter')
+        for app, (sessions, payload_bytes) in SESSION_COUNTS.items():
+            labels = 'app="{}",pid="{}"'.format(app, pid)
+            lines.append('pyrenemofs_sessions_total{{{}}} {}'.format(labels, sessions))
+            if SESSION_LOG:
+                lines.append('pyrenemofs_session_payload_bytes_total{{{}}} {}'.format(labels, payload_bytes))
+
+    lines.append('# TYPE pyrenemofs_cache_entries gauge')
+    for name, func in _CACHED_FUNCTIONS.items():
+        info = func.cache_info()
+        size = info['size'] if isinstance(info, dict) else info.currsize
+        lines.append('pyrenemofs_cache_entries{{function="{}",pid="{}"}} {}'.format(name, pid, size))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,130 @@
+"""Background refresher of the cached data.
+
+One daemon thread per server process warms the caches at startup, then polls cheaply for changes of the data: the
+modification times of the snapshot, CIF store and info CSV if a snapshot is used, otherwise the number of curated
+groups, the number of their tagged nodes and their latest modification time in the AiiDA database.
+
+When the data changed, the caches of the next generation (see pipeline_pyrenemofs.cache) are filled in the background,
+while the sessions keep reading the current one, and then swapped in at once.
+"""
+import logging
+import os
+import threading
+
+from pipeline_pyrenemofs import GROUP_DIR, INFO_CSV, TAG_KEY, load_profile, warm_caches
+from pipeline_pyrenemofs.cache import building_generation, publish_generation
+from pipeline_pyrenemofs.cifstore import CIF_STORE_DIR, INDEX_FILENAME
+from pipeline_pyrenemofs.snapshot import SNAPSHOT_PATH
+
+REFRESH_INTERVAL = float(os.getenv('PYRENEMOFS_REFRESH_INTERVAL', '300'))  # seconds, 0 to never poll
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _mtime(path):
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+
+def get_fingerprint():
+    """Return a value that changes when the data served by the apps changes."""
+    files = (_mtime(INFO_CSV),)
+    if os.path.isfile(SNAPSHOT_PATH):
+        return ('snapshot', _mtime(SNAPSHOT_PATH), _mtime(os.path.join(CIF_STORE_DIR, INDEX_FILENAME))) + files
+
+    from aiida.orm.querybuilder import QueryBuilder
+    from aiida.orm import Node, Group
+    load_profile()
+
+    group_filters = {'label': {'like': r'{}\_%\_v%'.format(GROUP_DIR)}}
+    ngroups = QueryBuilder().append(Group, filters=group_filters).count()
+
+    qb = QueryBuilder()
+    qb.append(Group, filters=group_filters, tag='g')
+    qb.append(Node, filters={'extras': {'has_key': TAG_KEY}}, with_group='g', tag='n', project=['mtime'])
+    nnodes = qb.count()
+    qb.order_by({'n': {'mtime': 'desc'}}).limit(1)
+    last_mtime = qb.first()
+
+    return ('database', ngroups, nnodes, str(last_mtime[0]) if last_mtime else None) + files
+
+
+class Refresher(threading.Thread):
+    """Daemon thread running the warmers at startup, and again in a new generation whenever the data changes."""
+
+    def __init__(self, interval=REFRESH_INTERVAL):
+        super().__init__(name='pyrenemofs-refresher', daemon=True)
+        self.interval = interval
+        self.warmers = []
+        self.fingerprint = None
+        self._pending = []  # warmers to run on the current generation
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+
+    def add_warmer(self, warmer):
+        """Add a function filling caches: it is run as soon as possible, and after every refresh."""
+        with self._lock:
+            self.warmers.append(warmer)
+            self._pending.append(warmer)
+        self._wake.set()
+
+    @staticmethod
+    def _run_warmers(warmers):
+        for warmer in warmers:
+            try:
+                warmer()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to warm the caches with %s", warmer.__name__)
+
+    def refresh(self):
+        """Fill the caches of the next generation with all the warmers, then publish it."""
+        with self._lock:
+            warmers = list(self.warmers)
+        with building_generation() as generation:
+            self._run_warmers(warmers)
+        publish_generation(generation)
+        LOGGER.info("Data refreshed: generation %d", generation)
+
+    def run(self):
+        try:
+            self.fingerprint = get_fingerprint()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception("Failed to read the data fingerprint")
+
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            self._run_warmers(pending)
+
+            timeout = self.interval if self.interval > 0 else None
+            if self._wake.wait(timeout):
+                self._wake.clear()
+                continue  # new warmers
+            try:
+                fingerprint = get_fingerprint()
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to read the data fingerprint")
+                continue
+            if fingerprint != self.fingerprint:
+                self.refresh()
+                self.fingerprint = fingerprint
+
+
+_REFRESHER = []
+_REFRESHER_LOCK = threading.Lock()
+
+
+def start_refresher(*warmers):
+    """Start the refresher of the process (once), warming the caches with warm_caches and the given warmers.
+
+    Called by the server_lifecycle.py hooks of the apps, i.e. once per app and server process.
+    """
+    with _REFRESHER_LOCK:
+        if not _REFRESHER:
+            refresher = Refresher()
+            refresher.add_warmer(warm_caches)
+            refresher.start()
+            _REFRESHER.append(refresher)
+        refresher = _REFRESHER[0]
+    for warmer in warmers:
+        refresher.add_warmer(warmer)
+    return refresher
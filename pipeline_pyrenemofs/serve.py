@@ -0,0 +1,124 @@
+"""Serve the Bokeh apps, together with the CIF files of the materials and the metrics of the process over plain HTTP.
+
+The CIFs are served at <prefix>/cif/<mat_id>/<tag>.cif (e.g., /cif/ABAVIJ/opt_cif_ddec.cif), with an ETag (the SHA-256
+of the content, with a -gz suffix when gzipped) and gzip encoding, so that browsers and proxies can cache them. The
+detail pages then load the structures by URL, instead of embedding them in the Bokeh documents.
+
+The counters of pipeline_pyrenemofs.metrics are served at <prefix>/metrics, in the Prometheus text format. With
+--num-procs, each request is answered by one of the processes.
+
+Usage:
+
+    python -m pipeline_pyrenemofs.serve detail_pyrenemofs figure_pyrenemofs select_pyrenemofs [--port 5006] \
+        [--prefix PREFIX] [--num-procs N] [--allow-websocket-origin HOST] [--use-xheaders]
+"""
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+
+from tornado.ioloop import IOLoop
+from tornado.web import HTTPError, RequestHandler
+
+from pipeline_pyrenemofs import get_mat_nodes_dict
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.metrics import timed, format_metrics
+
+CIF_ROUTE = r'/cif/(\w+)/(\w+)\.cif'
+METRICS_ROUTE = r'/metrics'
+CIF_URL = 'cif/{mat_id}/{tag}.cif'  # relative to the app pages
+CIF_MAX_AGE = int(os.getenv('PYRENEMOFS_CIF_MAX_AGE', '86400'))  # seconds
+
+# Set when the CIF endpoint is mounted: otherwise, e.g. with `panel serve`, the CIFs are embedded in the documents
+CIF_ENDPOINT_MOUNTED = False
+
+
+def get_cif_url(mat_id, tag):
+    """Return the URL of a CIF, relative to the app pages, or None if the CIF endpoint is not mounted."""
+    if not CIF_ENDPOINT_MOUNTED:
+        return None
+    return CIF_URL.format(mat_id=mat_id, tag=tag)
+
+
+@timed
+@ttl_cache()
+def get_cif_payload(mat_id, tag):
+    """Return (sha256, content, gzipped content) of the CIF of a material, as bytes.
+
+    :raises KeyError: if the material has no CIF with this tag.
+    """
+    node = get_mat_nodes_dict(mat_id)[tag]
+    content = node.get_content()
+    if content is None:
+        raise KeyError(tag)
+    content = content.encode('utf-8')
+    sha256 = getattr(node, 'content_sha256', None) or hashlib.sha256(content).hexdigest()
+    return sha256, content, gzip.compress(content)
+
+
+class CifHandler(RequestHandler):  # pylint: disable=abstract-method
+    """Serve the CIF of a material, honouring If-None-Match and Accept-Encoding."""
+
+    async def get(self, mat_id, tag):  # pylint: disable=arguments-differ
+        try:
+            # get_mat_nodes_dict may query the database: do not block the IOLoop
+            sha256, content, gzipped = await IOLoop.current().run_in_executor(None, get_cif_payload, mat_id, tag)
+        except KeyError:
+            raise HTTPError(404)
+
+        self.set_header('Content-Type', 'chemical/x-cif')
+        self.set_header('Cache-Control', 'public, max-age={}'.format(CIF_MAX_AGE))
+        self.set_header('Vary', 'Accept-Encoding')
+        use_gzip = 'gzip' in self.request.headers.get('Accept-Encoding', '')
+        self.set_header('ETag', '"{}-gz"'.format(sha256) if use_gzip else '"{}"'.format(sha256))  # one per encoding
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if use_gzip:
+            self.set_header('Content-Encoding', 'gzip')
+            self.write(gzipped)
+        else:
+            self.write(content)
+
+
+class MetricsHandler(RequestHandler):  # pylint: disable=abstract-method
+    """Serve the process-wide counters of pipeline_pyrenemofs.metrics."""
+
+    def get(self):
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.set_header('Cache-Control', 'no-cache')
+        self.write(format_metrics())
+
+
+def main():
+    from bokeh.command.util import build_single_handler_applications
+    from bokeh.server.server import Server
+    from pipeline_pyrenemofs import serve  # this file runs as __main__: flag the module imported by the apps
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('apps', nargs='+', help="Directories of the Bokeh apps.")
+    parser.add_argument('--port', type=int, default=5006)
+    parser.add_argument('--prefix', default=None, help="URL prefix of all the routes.")
+    parser.add_argument('--num-procs', type=int, default=1, help="Number of server processes (0: one per CPU core).")
+    parser.add_argument('--allow-websocket-origin', action='append', default=None)
+    parser.add_argument('--use-xheaders', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    serve.CIF_ENDPOINT_MOUNTED = True  # before forking, so that all the processes see it
+    applications = build_single_handler_applications(args.apps)
+    server = Server(applications,
+                    port=args.port,
+                    prefix=args.prefix,
+                    num_procs=args.num_procs,
+                    allow_websocket_origin=args.allow_websocket_origin,
+                    use_xheaders=args.use_xheaders,
+                    extra_patterns=[(CIF_ROUTE, serve.CifHandler), (METRICS_ROUTE, serve.MetricsHandler)])
+    server.start()
+    server.io_loop.start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Similar materials: nearest neighbours in the space of the properties shown in the figure.
+
+The quantities of the property table are standardized (zero mean, unit variance; missing values at the mean), optionally
+together with the elements of the materials, and indexed in a KD-tree. The index is built once per data generation and
+shared by all the sessions of the process.
+"""
+import numpy as np
+
+from pipeline_pyrenemofs import get_elements, get_property_table, get_quantities
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.metrics import timed
+
+ELEMENTS_WEIGHT = 0.5  # distance between two materials differing by one element, in standard deviations
+
+
+class SimilarityIndex():
+    """KD-tree over the standardized properties of the materials."""
+
+    def __init__(self, mat_ids, features):
+        from scipy.spatial import cKDTree
+
+        self.mat_ids = np.asarray(mat_ids)
+        self.positions = {mat_id: i for i, mat_id in enumerate(self.mat_ids)}
+        self.features = features
+        self.tree = cKDTree(features)
+
+    @classmethod
+    def from_table(cls, table, feature_ids, elements=None, elements_weight=ELEMENTS_WEIGHT):
+        """Build the index from the columns feature_ids of a property table, and optionally {mat_id: 'H, C, ...'}."""
+        values = table[feature_ids].to_numpy(dtype=np.float64)
+        std = np.nanstd(values, axis=0)
+        features = (values - np.nanmean(values, axis=0)) / np.where(std > 0, std, 1.)
+        features = np.nan_to_num(features, nan=0.)
+
+        if elements is not None:
+            mat_elements = [set(elements.get(mat_id, '').split(', ')) - {''} for mat_id in table.index]
+            columns = sorted(set.union(set(), *mat_elements))
+            onehot = np.array([[element in found for element in columns] for found in mat_elements], dtype=np.float64)
+            features = np.hstack([features, onehot.reshape(len(table), len(columns)) * elements_weight])
+
+        return cls(table.index.to_numpy(), features)
+
+    def __len__(self):
+        return len(self.mat_ids)
+
+    def _results(self, distances, indices, mat_id):
+        return [(str(self.mat_ids[i]), float(d)) for d, i in zip(distances, indices) if self.mat_ids[i] != mat_id]
+
+    def nearest(self, mat_id, k=5):
+        """Return the k nearest materials to mat_id, as a list of (mat_id, distance)."""
+        k = min(k + 1, len(self))  # the material itself is found first
+        distances, indices = self.tree.query(self.features[self.positions[mat_id]], k=k)
+        return self._results(np.atleast_1d(distances), np.atleast_1d(indices), mat_id)[:k - 1]
+
+    def within(self, mat_id, radius):
+        """Return the materials within radius of mat_id, as a list of (mat_id, distance) sorted by distance."""
+        point = self.features[self.positions[mat_id]]
+        indices = np.array(self.tree.query_ball_point(point, radius), dtype=int)
+        distances = np.linalg.norm(self.features[indices] - point, axis=1)
+        order = np.argsort(distances, kind='mergesort')
+        return self._results(distances[order], indices[order], mat_id)
+
+
+def get_feature_ids():
+    """Return the ids of the quantities indexed: all the quantities of the figure, but is_optimized."""
+    return [q['id'] for q in get_quantities().values() if q['key'] != 'is_optimized']
+
+
+@timed
+@ttl_cache(ttl=None)
+def get_similarity_index():
+    """Return the SimilarityIndex of all the curated materials, over their properties and elements."""
+    return SimilarityIndex.from_table(get_property_table(), get_feature_ids(), elements=get_elements())
+
+
+def get_similar(mat_id, k=5):
+    """Return the k materials most similar to mat_id, as a list of (mat_id, distance)."""
+    return get_similarity_index().nearest(mat_id, k)
@@ -0,0 +1,183 @@
+"""Materialized snapshot of the curated node graph.
+
+The snapshot is built once from the AiiDA database and written to a gzipped JSON file, which the apps load at startup
+instead of querying the database. Build it with:
+
+    python -m pipeline_pyrenemofs.snapshot [-o snapshot.json.gz] [--cif-store]
+
+With --cif-store, the CIF contents are written to the content-addressed store (see pipeline_pyrenemofs.cifstore) and
+the snapshot only references them by SHA-256.
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+from copy import deepcopy
+from os.path import join
+
+from pipeline_pyrenemofs import TAG_KEY, GROUP_DIR, CONFIG_DIR
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.cifstore import CIF_STORE_DIR, CifStoreWriter
+from pipeline_pyrenemofs.metrics import timed
+
+SNAPSHOT_VERSION = 3
+SNAPSHOT_PATH = os.getenv('PYRENEMOFS_SNAPSHOT', join(CONFIG_DIR, 'snapshot.json.gz'))
+
+
+class SnapshotNode():
+    """Read-only stand-in for a stored AiiDA node.
+
+    Exposes the subset of the Node/Dict/CifData interface used by the apps, without any database access.
+    """
+
+    def __init__(self, uuid, label, node_type, attributes, extras, content=None, content_sha256=None):
+        self.uuid = uuid
+        self.label = label
+        self.node_type = node_type
+        self.attributes = attributes
+        self.extras = extras
+        self.content = content
+        self.content_sha256 = content_sha256
+
+    @classmethod
+    def from_dict(cls, record):
+        return cls(**record)
+
+    def to_dict(self):
+        return {
+            'uuid': self.uuid,
+            'label': self.label,
+            'node_type': self.node_type,
+            'attributes': self.attributes,
+            'extras': self.extras,
+            'content': self.content,
+            'content_sha256': self.content_sha256,
+        }
+
+    def __getitem__(self, key):
+        """Access attributes as for a Dict node."""
+        return self.attributes[key]
+
+    def get_dict(self):
+        return deepcopy(self.attributes)
+
+    def get_content(self):
+        """Return the CIF content, from the snapshot, from the CIF store, or else from the AiiDA repository.
+
+        Nodes built from projected query rows have no content: it is loaded from the repository on first access.
+        """
+        if self.content is None and self.content_sha256 is not None:
+            from pipeline_pyrenemofs.cifstore import get_cif_store
+            return get_cif_store().get_text(self.content_sha256)
+        if self.content is None and self.node_type.startswith('data.core.cif.'):
+            from aiida.orm import load_node
+            from pipeline_pyrenemofs import load_profile
+            load_profile()
+            self.content = load_node(self.uuid).get_content()
+        return self.content
+
+    def __repr__(self):
+        return "<{}: uuid: {} ({})>".format(self.__class__.__name__, self.uuid, self.extras.get(TAG_KEY))
+
+
+def build_snapshot(mat_list, cif_store_writer=None):
+    """Read every tagged node of the curated groups once, and return the snapshot as a JSON-serializable dict.
+
+    If a CifStoreWriter is given, the CIF contents are added to the store instead of the snapshot.
+    """
+    from pipeline_pyrenemofs import query_tagged_node_rows, pivot_node_rows, query_isotherm_nodes
+
+    # The rows are sorted by group label: if more versions are present, the last one wins
+    rows = query_tagged_node_rows(r'{}\_%\_v%'.format(GROUP_DIR))
+    materials = {}
+    for mat_label, nodes in pivot_node_rows(rows, mat_ids=set(mat_list)).items():
+        for tag, record in nodes.items():
+            if record.node_type.startswith('data.core.cif.'):
+                record.get_content()  # read from the repository
+                if cif_store_writer is not None:
+                    record.content_sha256 = cif_store_writer.add(record.content, refcode=mat_label, tag=tag)
+                    record.content = None
+            materials.setdefault(mat_label, {})[tag] = record.to_dict()
+
+    isotherms = {
+        mat_id: {gas: [record.to_dict() for record in records] for gas, records in gas_dict.items()
+                } for mat_id, gas_dict in query_isotherm_nodes(materials.keys()).items()
+    }
+
+    return {
+        'version': SNAPSHOT_VERSION,
+        'created': datetime.datetime.now().isoformat(),
+        'tag_key': TAG_KEY,
+        'group_dir': GROUP_DIR,
+        'materials': materials,
+        'isotherms': isotherms,
+    }
+
+
+def write_snapshot(snapshot, path=SNAPSHOT_PATH):
+    """Write the snapshot to disk, replacing any existing file atomically."""
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as handle:
+        json.dump(snapshot, handle, separators=(',', ':'), default=str)
+    os.replace(tmp_path, path)
+
+
+@timed
+def load_snapshot(path=SNAPSHOT_PATH):
+    """Load a snapshot from disk.
+
+    Returns a dictionary with the tagged nodes of each material, {'materials': {mat_id: {tag: SnapshotNode}}}, and
+    their isotherms, {'isotherms': {mat_id: {gas: [SnapshotNode, ...]}}}.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as handle:
+        snapshot = json.load(handle)
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError("Snapshot {} has version {}, expected {}: rebuild it.".format(
+            path, snapshot.get('version'), SNAPSHOT_VERSION))
+
+    return {
+        'materials': {
+            mat_id: {tag: SnapshotNode.from_dict(record) for tag, record in nodes.items()
+                    } for mat_id, nodes in snapshot['materials'].items()
+        },
+        'isotherms': {
+            mat_id: {gas: [SnapshotNode.from_dict(record) for record in records] for gas, records in gas_dict.items()
+                    } for mat_id, gas_dict in snapshot['isotherms'].items()
+        },
+    }
+
+
+@ttl_cache(ttl=None)
+def get_snapshot():
+    """Return the snapshot loaded from SNAPSHOT_PATH, or None if no snapshot was built."""
+    if not os.path.isfile(SNAPSHOT_PATH):
+        return None
+    return load_snapshot(SNAPSHOT_PATH)
+
+
+def main():
+    from pipeline_pyrenemofs import get_pyrene_mofs_df, load_profile
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-o', '--output', default=SNAPSHOT_PATH, help="Path of the snapshot file.")
+    parser.add_argument('--cif-store',
+                        nargs='?',
+                        const=CIF_STORE_DIR,
+                        help="Write the CIFs to the CIF store (default: {}).".format(CIF_STORE_DIR))
+    args = parser.parse_args()
+
+    load_profile()
+    mat_list = list(get_pyrene_mofs_df()['refcode'].values)
+    if args.cif_store:
+        with CifStoreWriter(args.cif_store) as writer:
+            snapshot = build_snapshot(mat_list, cif_store_writer=writer)
+    else:
+        snapshot = build_snapshot(mat_list)
+    write_snapshot(snapshot, args.output)
+    print("Snapshot of {} materials written to {}".format(len(snapshot['materials']), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 """Provenance table"""
 
+import math
 import panel as pn
-from select_pyrenemofs.table import get_table
+import param
+from bokeh.io import curdoc
+from pipeline_pyrenemofs.metrics import session_scope, track_session
+from select_pyrenemofs.table import get_table_page, SORT_COLUMNS
 
 
 def fake_button(link, label, button_type):
@@ -28,17 +32,57 @@ buttons.append(fake_button(
     label="Interactive Plot",
     button_type="primary"))
 
+class MaterialsTable(param.Parameterized):
+    """Table of the materials, filtered, sorted and paginated on the server: only the current page is sent."""
+
+    query = param.String(default='', doc="Filter by name, elements or ligand")
+    sort_by = param.ObjectSelector(default='#', objects=SORT_COLUMNS)
+    ascending = param.Boolean(default=True)
+    page_size = param.ObjectSelector(default=25, objects=[10, 25, 50, 100])
+    page = param.Integer(default=1, bounds=(1, None))
+    msg = pn.pane.HTML("")
+    _npages = 1  # number of pages of the current view
+
+    @param.depends('query', 'sort_by', 'ascending', 'page_size', watch=True)
+    def _reset_page(self):
+        self.page = 1
+
+    def previous_page(self, _event=None):
+        self.page = max(1, self.page - 1)
+
+    def next_page(self, _event=None):
+        self.page = min(self.page + 1, self._npages)
+
+    @param.depends('query', 'sort_by', 'ascending', 'page_size', 'page')
+    def view(self):
+        df_page, nrows = get_table_page(self.query, self.sort_by, self.ascending, self.page, self.page_size)
+        self._npages = max(1, math.ceil(nrows / self.page_size))
+        start = (self.page - 1) * self.page_size
+        self.msg.object = "Showing {}-{} of {} MOFs (page {} of {})".format(
+            min(start + 1, nrows), start + len(df_page), nrows, self.page, self._npages)
+        return pn.pane.HTML(
+            df_page.to_html(
+                escape=False,  # keep html images
+                classes='table table-striped table-hover'),
+            style={
+                'border': '3px solid black',
+                'border-radius': '10px',
+                'padding': '0px'
+            })
+
+
+table = MaterialsTable()
+
+prev_button = pn.widgets.Button(name='< Previous', width=100)
+prev_button.on_click(table.previous_page)
+next_button = pn.widgets.Button(name='Next >', width=100)
+next_button.on_click(table.next_page)
+
 t = pn.Column()
 t.append(buttons)
-t.append(
-    pn.pane.HTML(
-        get_table().to_html(
-            escape=False,  # keep html images
-            classes='table table-striped table-hover'),
-        style={
-            'border': '3px solid black',
-            'border-radius': '10px',
-            'padding': '0px'
-        }))
-
-t.servable()
+t.append(pn.Row(pn.Param(table.param, parameters=['query', 'sort_by', 'ascending', 'page_size'], show_name=False)))
+t.append(pn.Row(prev_button, next_button, table.msg))
+t.append(table.view)
+
+with session_scope(track_session(curdoc(), 'select_pyrenemofs')):
+    t.servable()  # renders the first page
@@ -1,9 +1,8 @@
 """Provenance table"""
 
-import re
-from functools import lru_cache
-from pipeline_pyrenemofs import get_db_nodes_dict, get_pyrene_mofs_df, load_profile
-load_profile()
+from pipeline_pyrenemofs import get_db_nodes_dict, get_elements, get_pyrene_mofs_df, get_property_table, get_quantities
+from pipeline_pyrenemofs.cache import ttl_cache
+from pipeline_pyrenemofs.metrics import timed
 
 AIIDA_LOGO_URL = "select_pyrenemofs/static/images/aiida-128.png"
 DOI_LOGO_URL = 'select_pyrenemofs/static/images/paper-128.png'
@@ -23,49 +22,73 @@ def detail_link(mat_id):
         mat_id, MAT_LOGO_URL)
 
 
-@lru_cache()
-def get_elements_from_cifdata(cifdata):
-    formula = cifdata.get_ase().get_chemical_formula()
-    elements = [e for e in re.split(r'\d+', formula) if e]
-    return ",".join(elements)
-
-
-@lru_cache(maxsize=1)
+@timed
+@ttl_cache(ttl=None)
 def get_table():
     """Get the entries for the right table of select-figure."""
     import pandas as pd
 
     pd.set_option('max_colwidth', 10)
 
-    df_info = get_pyrene_mofs_df()
-    df_tabl = pd.DataFrame(columns=[  # Set the order of the columns
-        'Name', 'Article', 'Elements', 'Surface (m2/g)', 'Structure'
-    ])
-
     db_nodes_dict = get_db_nodes_dict()
-
-    for _i, df_info_row in df_info.iterrows():
-        mat_id = df_info_row['refcode']
-        mat_dict = db_nodes_dict[mat_id]
-        #mat_dict['orig_cif'].set_extra('name_conventional', df_info_row['name']) # Used to correct materials' info!
-        new_row = {
-            'Order': df_info_row['idx'],
-            'Name': mat_dict['orig_cif'].extras['name_conventional'],
-            'Article': doi_link(mat_dict),
-            'Elements': df_info_row['elements'],  #not working bad cif: get_elements_from_cifdata(mat_dict['orig_cif']),
-            'Structure': detail_link(mat_id),
-            'Ligand': df_info_row['ligand']
-        }
-
-        if 'opt_zeopp' in mat_dict:
-            new_row['Surface (m2/g)'] = int(mat_dict['opt_zeopp']['ASA_m^2/g'])
-        else:
-            new_row['Surface (m2/g)'] = int(mat_dict['orig_zeopp']['ASA_m^2/g'])
-
-        df_tabl = df_tabl.append(new_row, ignore_index=True)
-
-    df_tabl = df_tabl.sort_values(by=['Order'])
+    df_info = get_pyrene_mofs_df()
+    df_info = df_info[df_info['refcode'].isin(db_nodes_dict.keys())]  # e.g., a CIF missing from the ingest
+    mat_ids = df_info['refcode'].to_numpy()
+    mat_dicts = [db_nodes_dict[mat_id] for mat_id in mat_ids]
+    #mat_dict['orig_cif'].set_extra('name_conventional', df_info_row['name']) # Used to correct materials' info!
+
+    # The surface is taken from opt_zeopp if the material was DFT optimized, from orig_zeopp otherwise
+    surface_id = get_quantities()['Accessible Surface Area']['id']
+    surface = get_property_table().loc[mat_ids, surface_id].round().astype('Int64').array  # <NA> if not computed
+
+    # The elements are read from the CIFs, the info CSV is only a fallback for the CIFs that cannot be parsed
+    elements = get_elements()
+    elements = [elements.get(mat_id, csv_elements) for mat_id, csv_elements in zip(mat_ids, df_info['elements'])]
+
+    df_tabl = pd.DataFrame({  # Set the order of the columns
+        'Order': df_info['idx'].to_numpy(),
+        'Name': [mat_dict['orig_cif'].extras['name_conventional'] for mat_dict in mat_dicts],
+        'Article': [doi_link(mat_dict) for mat_dict in mat_dicts],
+        'Elements': elements,
+        'Surface (m2/g)': surface,
+        'Structure': [detail_link(mat_id) for mat_id in mat_ids],
+        'Ligand': df_info['ligand'].to_numpy(),
+    })
+
+    df_tabl = df_tabl.sort_values(by=['Order'], kind='mergesort')
     df_tabl = df_tabl.drop(columns=['Order'])
     df_tabl = df_tabl.reset_index(drop=True)
     df_tabl.index += 1
     return df_tabl
+
+
+SORT_COLUMNS = ['#', 'Name', 'Elements', 'Surface (m2/g)', 'Ligand']  # '#' is the order of the info CSV
+FILTER_COLUMNS = ['Name', 'Elements', 'Ligand']
+
+
+@ttl_cache(maxsize=4 * len(SORT_COLUMNS), ttl=None)  # two generations during a refresh
+def get_sorted_table(sort_by='#', ascending=True):
+    """Get the table sorted by one of SORT_COLUMNS, cached for all sessions."""
+    df_tabl = get_table()
+    if sort_by == '#':
+        return df_tabl.sort_index(ascending=ascending)
+    return df_tabl.sort_values(by=sort_by, ascending=ascending, kind='mergesort')
+
+
+@timed
+def get_table_page(query='', sort_by='#', ascending=True, page=1, page_size=25):
+    """Filter, sort and paginate the table on the server.
+
+    :param query: case-insensitive text that must be found in one of FILTER_COLUMNS
+    :returns: the DataFrame of the requested page, and the number of rows matching the query
+    """
+    df_tabl = get_sorted_table(sort_by, ascending)
+    if query:
+        mask = None
+        for column in FILTER_COLUMNS:
+            column_mask = df_tabl[column].astype(str).str.contains(query, case=False, regex=False)
+            mask = column_mask if mask is None else mask | column_mask
+        df_tabl = df_tabl[mask]
+
+    start = (page - 1) * page_size
+    return df_tabl.iloc[start:start + page_size], len(df_tabl)
@@ -2,11 +2,15 @@
 set -x
 
 # This script is executed whenever the docker container is (re)started.
+# Set NUM_PROCS to the number of server processes to fork (0: one per CPU core).
+# Each process warms its own caches at startup, see */server_lifecycle.py
+# The apps are served together with the CIF endpoint (<prefix>/cif/...), see pipeline_pyrenemofs/serve.py
 #===============================================================================
-panel serve detail_pyrenemofs figure_pyrenemofs select_pyrenemofs \
+python -m pipeline_pyrenemofs.serve detail_pyrenemofs figure_pyrenemofs select_pyrenemofs \
     --port 5006                 \
     --allow-websocket-origin "*" \
     --prefix "$BOKEH_PREFIX" \
+    --num-procs "${NUM_PROCS:-1}" \
     --use-xheaders
 # --allow-websocket-origin discover.materialscloud.org 
 
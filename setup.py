@@ -24,5 +24,7 @@ if __name__ == '__main__':
               "jinja2~=3.0.0",
               "frozendict~=1.2",
               "numpy~=1.23.1",
+              "PyCifRW~=4.4",
+              "scipy~=1.9",
           ],
           extras_require={"pre-commit": ["pre-commit==1.17.0", "prospector==1.2.0", "pylint==2.4.0"]})